@@ -44,7 +44,7 @@ os.fsync(file.fileno()) # RAM file cache to disk
 _samplefreq = 250.0
 _rollingspan = 15.0
 _intsampletime = 1.0 / _samplefreq / 1
-masterdata = None
+masterdata = numpy.zeros((numberOfGetDataCalls * FrameLength, numberOfAcquiredChannels - 1), dtype=numpy.float32) # filled by index instead of growing
  
 device.StartAcquisition(False) # True - test signal; False - measurement mode
 cumulativeTime = core.Clock(); cumulativeTime.reset()
@@ -61,10 +61,7 @@ for i in range (0,numberOfGetDataCalls):
     data = numpy.frombuffer(receiveBuffer, dtype=numpy.float32, count=numberOfAcquiredChannels * FrameLength)
     data = numpy.reshape(data, (FrameLength, numberOfAcquiredChannels))
     
-    if masterdata is None:
-        masterdata = data[:,0:-1]
-    else:
-        masterdata = numpy.vstack([masterdata, data[:,0:-1]])
+    masterdata[(i * FrameLength):((i + 1) * FrameLength),:] = data[:,0:-1]
         
     time.sleep(_intsampletime)
      
@@ -0,0 +1,735 @@
+# eegpipe: functions for rapid processing of unicornhybridblack recordings after a session
+#
+"""
+A small EEGLAB style pipeline built on numpy arrays, so an ERP can be checked right after a
+task without a MATLAB round trip
+
+    EEG = eegpipe.readUnicornBlack('Raw\\VEP001.psydat')
+    EEG = eegpipe.simplefilter(EEG, Filter = 'Notch', Cutoff = [60.0])
+    EEG = eegpipe.simplefilter(EEG, Filter = 'Bandpass', Design = 'Butter', Cutoff = [1.0, 25.0], Order = 3)
+    EEG = eegpipe.simpleepoch(EEG, Window = [-200.0, 600.0], Types = [10008, 10009])
+    EEG = eegpipe.simplebaselinecorrect(EEG, Window = [-100.0, 0.0])
+    EEG = eegpipe.voltagethreshold(EEG, Threshold = [-100.0, 100.0], Step = 50.0)
+    EEG = eegpipe.simpleaverage(EEG, Approach = 'Mean', BaselineWindow = [-100.0, 0.0])
+    eegpipe.saveset(EEG, 'Raw\\VEP001.psydat')
+
+Continuous data is held as a (channels x points) array with an event table, epoched data
+as an (epochs x channels x points) array. Every function works on whole arrays at once:
+filters are zero phase second order sections along the time axis, and epochs are cut with
+a single fancy index.
+
+batchprocess() runs a declared pipeline over every recording in a folder, in parallel, and
+merges the averages into one group table
+
+    if __name__ == '__main__':
+        eegpipe.batchprocess('Raw', Pipeline = eegpipe.VEPPipeline, Workers = 4)
+
+runpipeline() does the same for a single recording. Both keep the result of every step in an
+on disk cache (EEGCache), keyed by the hash of the recording files, the step, and its
+arguments, so changing a late step (such as the epoch window) starts from the longest cached
+prefix of the pipeline instead of reading and filtering the recording again.
+
+As with the loadunicornhybridblack EEGLAB plugin, when a .psydat file from the same session
+is found the stimulus event types are recoded based on the behavioral responses
+    correct trials are increased by 10,000
+    errors of commission are increased by 50,000
+    errors of omission are increased by 60,000
+
+@author: Matt Pontifex
+"""
+
+import os
+import csv
+import json
+import math
+import hashlib
+import concurrent.futures
+import numpy
+import scipy.signal
+
+try:
+    import unicornhybridblackreader as unicornhybridblackreader
+except:
+    import Engine.unicornhybridblackreader as unicornhybridblackreader
+
+
+# processing steps after readUnicornBlack, as (function name, keyword arguments), used by batchprocess
+VEPPipeline = [('simplefilter', {'Filter': 'Notch', 'Cutoff': [60.0]}),
+               ('simplefilter', {'Filter': 'Bandpass', 'Design': 'Butter', 'Cutoff': [1.0, 25.0], 'Order': 3}),
+               ('simpleepoch', {'Window': [-200.0, 600.0], 'Types': [10008, 10009]}),
+               ('simplebaselinecorrect', {'Window': [-100.0, 0.0]}),
+               ('voltagethreshold', {'Threshold': [-100.0, 100.0], 'Step': 50.0}),
+               ('simpleaverage', {'Approach': 'Mean', 'BaselineWindow': [-100.0, 0.0]})]
+
+EEGEventType = numpy.dtype([('latency', '<f8'), ('type', '<i8'), ('urtype', '<i8'), ('correct', '<f8'), ('resplatency', '<f8')])
+
+
+class EEGset():
+    """container for continuous or epoched EEG data
+    """
+
+    def __init__(self):
+        self.setname = ''
+        self.filename = ''
+        self.filepath = ''
+        self.srate = 250.0
+        self.chanlabels = []
+        self.data = numpy.zeros((0, 0)) # (channels x points), or (epochs x channels x points) once epoched
+        self.times = numpy.zeros(0) # milliseconds, from the start of the recording or relative to the event
+        self.events = numpy.zeros(0, dtype=EEGEventType) # latency in points from the start of the recording
+        self.trials = 1
+        self.epochevents = numpy.zeros(0, dtype=EEGEventType) # the event each epoch was cut around
+        self.dropped = 0 # points missing from the recording, filled by interpolation
+        self.rejected = numpy.zeros(0, dtype=numpy.int64) # epochs removed by voltagethreshold
+        self.freqs = None
+        self.psd = None # (epochs x channels x frequencies)
+        self.zwave = None # (epochs x channels x points)
+        self.erp = None # (types x channels x points)
+        self.erptypes = None
+        self.erpcounts = None
+        self.history = []
+        self.pipeline = None # key of the batchprocess pipeline that produced the set
+
+
+def _readpsydat(filename):
+    # stimulus rows of a PsychoPy_Engine_3 behavioral file
+    # 0-Trial 1-Event 2-Duration 3-ISI 4-ITI 5-Type 6-Resp 7-Correct 8-Latency 9-ClockLatency 10-Trigger
+    stimuli = []
+    psydat = open(filename, 'r')
+    lines = psydat.readlines()
+    psydat.close()
+    if (len(lines) == 0) or not lines[0].startswith('gentask.....= PsychoPy_Engine_3'):
+        return stimuli
+    for line in lines:
+        fields = line.split()
+        if (len(fields) < 11) or not fields[0].isdigit():
+            continue
+        if (fields[1] != 'Stimulus'):
+            continue
+        try:
+            if (int(float(fields[10])) == 0) or (int(float(fields[5])) == 0):
+                continue # no trigger was sent
+            stimuli.append((int(float(fields[5])), fields[6], float(fields[7]), float(fields[8])))
+        except ValueError:
+            continue
+    return stimuli
+
+def _mergepsydat(events, stimuli):
+    # align the behavioral stimuli with the recorded events and recode the event types
+    codes = events['urtype']
+    eegindex = [incrX for incrX in range(len(events)) if (codes[incrX] != 0)]
+    commoncodes = set([codes[incrX] for incrX in eegindex]) & set([stimulus[0] for stimulus in stimuli])
+    eegindex = [incrX for incrX in eegindex if codes[incrX] in commoncodes]
+    stimuli = [stimulus for stimulus in stimuli if stimulus[0] in commoncodes]
+
+    cRdat = 0
+    cReeg = 0
+    merged = 0
+    while (cRdat < len(stimuli)) and (cReeg < len(eegindex)):
+        if (stimuli[cRdat][0] == codes[eegindex[cReeg]]):
+            event = events[eegindex[cReeg]]
+            code, resp, correct, resplatency = stimuli[cRdat]
+            event['correct'] = correct
+            event['resplatency'] = resplatency
+            if (correct == 1):
+                event['type'] = code + 10000
+            elif (resp != 'nan'):
+                event['type'] = code + 50000 # error of commission
+            else:
+                event['type'] = code + 60000 # error of omission
+            events[eegindex[cReeg]] = event
+            merged = merged + 1
+            cRdat = cRdat + 1
+            cReeg = cReeg + 1
+        else:
+            # look up to two events ahead in either stream for a missing event
+            matched = False
+            for step in [1, 2]:
+                if ((cRdat + step) < len(stimuli)) and (stimuli[cRdat + step][0] == codes[eegindex[cReeg]]):
+                    cRdat = cRdat + step
+                    matched = True
+                    break
+                if ((cReeg + step) < len(eegindex)) and (stimuli[cRdat][0] == codes[eegindex[cReeg + step]]):
+                    cReeg = cReeg + step
+                    matched = True
+                    break
+            if not matched:
+                cRdat = cRdat + 1
+                cReeg = cReeg + 1
+    return merged
+
+def readUnicornBlack(inputfile, Channels = None, Gain = 2.0, Behavior = True):
+    """Reads a unicornhybridblack recording (.csv/.csve or .bin/.bine) into an EEGset
+
+    inputfile   --  recording or .psydat name, with or without extension
+    Channels    --  channel labels to keep, the eight EEG channels if None
+    Gain        --  multiplier applied to the data, the EEGLAB plugin doubles the gain
+    Behavior    --  merge the .psydat file of the same session into the event types
+    """
+    basename, extension = os.path.splitext(inputfile)
+    if extension.lower() not in ['.csv', '.csve', '.bin', '.bine', '.json', '.psydat']:
+        basename = inputfile
+    recording = unicornhybridblackreader.UnicornBlackReader(basename)
+
+    EEG = EEGset()
+    EEG.setname = os.path.basename(basename)
+    EEG.filename = os.path.basename(recording._datafile)
+    EEG.filepath = os.path.dirname(basename)
+    EEG.srate = recording.samplerate
+    if Channels is None:
+        Channels = recording.channellabels[0:8]
+    channelindex = recording.channelindex(Channels)
+    EEG.chanlabels = [recording.channellabels[incrX].upper() for incrX in channelindex]
+
+    # place every sample on a regular grid of the sample counter, dropped samples are interpolated
+    counter = numpy.array(recording.data[:, recording.channels - 1], dtype=numpy.int64)
+    valid = numpy.flatnonzero(counter > 0)
+    counter = counter[valid]
+    if (len(counter) == 0):
+        raise ValueError("No samples with a valid sample counter in '%s'." % (recording._datafile))
+    first = int(counter[0])
+    points = int(counter[-1]) - first + 1
+    gridindex = counter - first
+    values = numpy.array(recording.data[valid,:][:, channelindex], dtype=numpy.float64).T * float(Gain)
+    EEG.data = numpy.full((len(channelindex), points), numpy.nan)
+    EEG.data[:, gridindex] = values
+    present = numpy.zeros(points, dtype=bool)
+    present[gridindex] = True
+    EEG.dropped = int(points - numpy.sum(present))
+    if (EEG.dropped > 0):
+        missing = numpy.flatnonzero(~present)
+        for incrX in range(EEG.data.shape[0]):
+            EEG.data[incrX, missing] = numpy.interp(missing, gridindex, EEG.data[incrX, gridindex])
+        if (EEG.dropped > 2):
+            print('Warning: A total of %d out of %d (%.1f%%) sampling points were dropped during collection' % (EEG.dropped, points, (float(EEG.dropped) / points) * 100.0))
+    EEG.times = numpy.arange(points) * 1000.0 / EEG.srate
+
+    recordedevents = recording.events
+    EEG.events = numpy.zeros(len(recordedevents), dtype=EEGEventType)
+    EEG.events['latency'] = (recordedevents['latency'] - first)
+    if 'offset' in recordedevents.dtype.names:
+        EEG.events['latency'] = EEG.events['latency'] + recordedevents['offset']
+    EEG.events['type'] = recordedevents['event']
+    EEG.events['urtype'] = recordedevents['event']
+    EEG.events['correct'] = numpy.nan
+    EEG.events['resplatency'] = numpy.nan
+
+    if Behavior and os.path.isfile('%s.psydat' % (basename)):
+        merged = _mergepsydat(EEG.events, _readpsydat('%s.psydat' % (basename)))
+        EEG.history.append("merged %d events with '%s.psydat'" % (merged, basename))
+    EEG.history.append("EEG = readUnicornBlack('%s')" % (inputfile))
+    return EEG
+
+def simplefilter(EEG, Filter = 'Bandpass', Design = 'Butter', Cutoff = [1.0, 25.0], Order = 3, FrameLength = None):
+    """Zero phase filtering along the time axis
+
+    Filter      --  Bandpass, Highpass, Lowpass, or Notch
+    Design      --  Butter, or savitzky-golay for polynomial smoothing (Order is the polynomial order)
+    Cutoff      --  frequencies in Hz
+    FrameLength --  points in each savitzky-golay frame, about 50 ms if None
+    """
+    if (Design.lower() in ['savitzky-golay', 'savitzkygolay', 'sgolay']):
+        if FrameLength is None:
+            FrameLength = (2 * int(round(0.025 * EEG.srate))) + 1
+        FrameLength = max(int(FrameLength) | 1, int(Order) + 2 - (int(Order) % 2)) # odd and longer than the order
+        EEG.data = scipy.signal.savgol_filter(EEG.data, FrameLength, int(Order), axis=-1)
+    else:
+        if (Filter.lower() == 'notch'):
+            b, a = scipy.signal.iirnotch(float(Cutoff[0]), 30.0, EEG.srate)
+            sos = scipy.signal.tf2sos(b, a)
+        elif (Filter.lower() == 'bandpass'):
+            sos = scipy.signal.butter(int(Order), [float(Cutoff[0]), float(Cutoff[1])], btype='bandpass', output='sos', fs=EEG.srate)
+        else:
+            sos = scipy.signal.butter(int(Order), float(Cutoff[0]), btype=Filter.lower(), output='sos', fs=EEG.srate)
+        EEG.data = scipy.signal.sosfiltfilt(sos, EEG.data, axis=-1)
+    EEG.history.append("EEG = simplefilter(EEG, Filter = '%s', Design = '%s', Cutoff = %s, Order = %d)" % (Filter, Design, str(Cutoff), int(Order)))
+    return EEG
+
+def simpleepoch(EEG, Window = [-200.0, 600.0], Types = None):
+    """Cuts (epochs x channels x points) segments around the events
+
+    Window      --  [start, stop] in milliseconds relative to each event
+    Types       --  event types to epoch, all events if None
+    """
+    start = int(math.floor(Window[0] * EEG.srate / 1000.0))
+    stop = int(math.ceil(Window[1] * EEG.srate / 1000.0)) + 1
+    events = EEG.events
+    if Types is not None:
+        events = events[numpy.isin(events['type'], Types)]
+    latencies = numpy.round(events['latency']).astype(numpy.int64)
+    inrange = ((latencies + start) >= 0) & ((latencies + stop) <= EEG.data.shape[1])
+    events = events[inrange]
+    latencies = latencies[inrange]
+
+    index = latencies[:,numpy.newaxis] + numpy.arange(start, stop)[numpy.newaxis,:] # (epochs x points)
+    EEG.data = numpy.transpose(EEG.data[:, index], (1, 0, 2)) # (channels x epochs x points) to (epochs x channels x points)
+    EEG.times = numpy.arange(start, stop) * 1000.0 / EEG.srate
+    EEG.epochevents = events.copy()
+    EEG.trials = EEG.data.shape[0]
+    EEG.history.append("EEG = simpleepoch(EEG, Window = %s, Types = %s)" % (str(Window), str(Types)))
+    return EEG
+
+def _windowindex(EEG, Window):
+    # points of the epoch that fall inside a [start, stop] window in milliseconds
+    index = numpy.flatnonzero((EEG.times >= Window[0]) & (EEG.times <= Window[1]))
+    if (len(index) == 0):
+        index = numpy.array([int(numpy.argmin(numpy.abs(EEG.times - Window[0])))])
+    return index
+
+def simplebaselinecorrect(EEG, Window = [-100.0, 0.0]):
+    """Subtracts the mean of the baseline window from every epoch and channel
+    """
+    index = _windowindex(EEG, Window)
+    EEG.data = EEG.data - numpy.mean(EEG.data[..., index], axis=-1, keepdims=True)
+    EEG.history.append("EEG = simplebaselinecorrect(EEG, Window = %s)" % (str(Window)))
+    return EEG
+
+def voltagethreshold(EEG, Threshold = [-100.0, 100.0], Step = None, PrintOutput = False):
+    """Removes epochs where any channel leaves the threshold or jumps by more than Step
+    between adjacent points
+
+    Threshold   --  [minimum, maximum] in microvolts
+    Step        --  largest change between adjacent points in microvolts, not checked if None
+    PrintOutput --  report how many epochs were rejected
+    """
+    reject = numpy.any((EEG.data < Threshold[0]) | (EEG.data > Threshold[1]), axis=(1, 2))
+    if Step is not None:
+        reject = reject | numpy.any(numpy.abs(numpy.diff(EEG.data, axis=-1)) > float(Step), axis=(1, 2))
+    EEG.rejected = numpy.flatnonzero(reject)
+    EEG.data = EEG.data[~reject]
+    EEG.epochevents = EEG.epochevents[~reject]
+    if EEG.psd is not None:
+        EEG.psd = EEG.psd[~reject]
+    if EEG.zwave is not None:
+        EEG.zwave = EEG.zwave[~reject]
+    EEG.trials = EEG.data.shape[0]
+    if PrintOutput:
+        print('voltagethreshold(): %d of %d epochs rejected.' % (len(EEG.rejected), len(reject)))
+    EEG.history.append("EEG = voltagethreshold(EEG, Threshold = %s, Step = %s)" % (str(Threshold), str(Step)))
+    return EEG
+
+def simplepsd(EEG, Scale = 500, Ceiling = None):
+    """Spectral power of every epoch and channel (stored in EEG.psd and EEG.freqs)
+
+    Scale       --  points in the fft, zero padded
+    Ceiling     --  highest frequency kept in Hz
+    """
+    segmentlength = min(int(Scale), EEG.data.shape[-1])
+    EEG.freqs, EEG.psd = scipy.signal.welch(EEG.data, fs=EEG.srate, window='hann', nperseg=segmentlength, noverlap=int(segmentlength / 2), nfft=max(int(Scale), segmentlength), detrend=False, scaling='density', axis=-1)
+    if Ceiling is not None:
+        keep = EEG.freqs <= float(Ceiling)
+        EEG.freqs = EEG.freqs[keep]
+        EEG.psd = EEG.psd[..., keep]
+    EEG.history.append("EEG = simplepsd(EEG, Scale = %d, Ceiling = %s)" % (int(Scale), str(Ceiling)))
+    return EEG
+
+def simplezwave(EEG, BaselineWindow = [-200.0, 0.0]):
+    """Expresses every epoch in standard deviations of its own baseline (stored in EEG.zwave)
+    """
+    index = _windowindex(EEG, BaselineWindow)
+    baseline = EEG.data[..., index]
+    deviation = numpy.std(baseline, axis=-1, ddof=1, keepdims=True)
+    deviation[deviation == 0.0] = numpy.nan
+    EEG.zwave = (EEG.data - numpy.mean(baseline, axis=-1, keepdims=True)) / deviation
+    EEG.history.append("EEG = simplezwave(EEG, BaselineWindow = %s)" % (str(BaselineWindow)))
+    return EEG
+
+def simpleaverage(EEG, Approach = 'Mean', BaselineWindow = None):
+    """Averages the epochs of each event type into EEG.erp (types x channels x points)
+
+    Approach        --  Mean or Median
+    BaselineWindow  --  [start, stop] in milliseconds to baseline correct the averages
+    """
+    EEG.erptypes = numpy.unique(EEG.epochevents['type'])
+    EEG.erp = numpy.zeros((len(EEG.erptypes), EEG.data.shape[1], EEG.data.shape[2]))
+    EEG.erpcounts = numpy.zeros(len(EEG.erptypes), dtype=numpy.int64)
+    for incrX, eventtype in enumerate(EEG.erptypes):
+        selection = EEG.epochevents['type'] == eventtype
+        EEG.erpcounts[incrX] = int(numpy.sum(selection))
+        if (Approach.lower() == 'median'):
+            EEG.erp[incrX] = numpy.median(EEG.data[selection], axis=0)
+        else:
+            EEG.erp[incrX] = numpy.mean(EEG.data[selection], axis=0)
+    if BaselineWindow is not None:
+        index = _windowindex(EEG, BaselineWindow)
+        EEG.erp = EEG.erp - numpy.mean(EEG.erp[..., index], axis=-1, keepdims=True)
+    EEG.history.append("EEG = simpleaverage(EEG, Approach = '%s', BaselineWindow = %s)" % (Approach, str(BaselineWindow)))
+    return EEG
+
+def saveset(EEG, outputfile):
+    """Saves the arrays of an EEGset to a .npz file next to the recording (and a .json description)
+    """
+    basename, extension = os.path.splitext(outputfile)
+    if extension.lower() not in ['.csv', '.csve', '.bin', '.bine', '.json', '.psydat', '.npz']:
+        basename = outputfile
+    arrays = {'data': EEG.data, 'times': EEG.times, 'events': EEG.events, 'epochevents': EEG.epochevents, 'rejected': EEG.rejected}
+    for key in ['freqs', 'psd', 'zwave', 'erp', 'erptypes', 'erpcounts']:
+        if getattr(EEG, key) is not None:
+            arrays[key] = getattr(EEG, key)
+    numpy.savez('%s_eegpipe.npz' % (basename), **arrays)
+
+    header = {'setname': EEG.setname, 'filename': EEG.filename, 'srate': float(EEG.srate), 'chanlabels': EEG.chanlabels, 'trials': int(EEG.trials), 'dropped': int(EEG.dropped), 'history': EEG.history, 'pipeline': EEG.pipeline}
+    headerfile = open('%s_eegpipe.json' % (basename), 'w')
+    json.dump(header, headerfile, indent=4)
+    headerfile.close()
+
+def loadset(inputfile):
+    """Reads an EEGset written by saveset
+    """
+    basename = inputfile
+    for suffix in ['_eegpipe.npz', '_eegpipe.json']:
+        if basename.endswith(suffix):
+            basename = basename[:-len(suffix)]
+    EEG = EEGset()
+    headerfile = open('%s_eegpipe.json' % (basename), 'r')
+    header = json.load(headerfile)
+    headerfile.close()
+    for key in header:
+        setattr(EEG, key, header[key])
+    arrays = numpy.load('%s_eegpipe.npz' % (basename))
+    for key in arrays.files:
+        setattr(EEG, key, arrays[key])
+    return EEG
+
+
+class EEGCache():
+    """on disk cache of EEGsets after each pipeline step
+
+    every entry is a .npy file holding EEG.data, with a .npz file for the other arrays and a
+    .json file for the description. The least recently used entries are removed once the
+    folder holds more than maxsize megabytes.
+    """
+
+    def __init__(self, folder, maxsize = 2048):
+        self.folder = folder
+        self.maxsize = maxsize # megabytes
+        self.printoutput = False
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder, exist_ok=True)
+
+    def recordingkey(self, files, arguments):
+        """Key of a recording read with readUnicornBlack(**arguments), from the content of its files
+        """
+        digest = hashlib.sha1()
+        for filename in sorted(files):
+            digest.update(os.path.basename(filename).encode())
+            filehandle = open(filename, 'rb')
+            for block in iter(lambda: filehandle.read(1048576), b''):
+                digest.update(block)
+            filehandle.close()
+        return self.stepkey(digest.hexdigest(), 'readUnicornBlack', arguments)
+
+    def stepkey(self, previouskey, functionname, arguments):
+        """Key of the set produced by applying a step to the set with previouskey
+        """
+        digest = hashlib.sha1()
+        digest.update(previouskey.encode())
+        digest.update(functionname.encode())
+        digest.update(json.dumps(arguments, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def _paths(self, key):
+        basename = os.path.join(self.folder, key)
+        return ['%s.npy' % (basename), '%s.npz' % (basename), '%s.json' % (basename)]
+
+    def contains(self, key):
+        return os.path.isfile(self._paths(key)[2])
+
+    def get(self, key):
+        """Returns the cached EEGset for a key, or None
+        """
+        datafile, arrayfile, headerfile = self._paths(key)
+        try:
+            headerhandle = open(headerfile, 'r')
+            header = json.load(headerhandle)
+            headerhandle.close()
+            EEG = EEGset()
+            for name in header:
+                setattr(EEG, name, header[name])
+            EEG.data = numpy.load(datafile)
+            arrays = numpy.load(arrayfile)
+            for name in arrays.files:
+                setattr(EEG, name, arrays[name])
+            arrays.close()
+        except (IOError, OSError, ValueError):
+            return None # removed by another process, or only partly written
+        for filename in [datafile, arrayfile, headerfile]:
+            try:
+                os.utime(filename) # most recently used
+            except OSError:
+                pass
+        return EEG
+
+    def put(self, key, EEG):
+        """Stores an EEGset, the header is written last so partial entries are never read
+        """
+        datafile, arrayfile, headerfile = self._paths(key)
+        arrays = {'times': EEG.times, 'events': EEG.events, 'epochevents': EEG.epochevents, 'rejected': EEG.rejected}
+        for name in ['freqs', 'psd', 'zwave', 'erp', 'erptypes', 'erpcounts']:
+            if getattr(EEG, name) is not None:
+                arrays[name] = getattr(EEG, name)
+        header = {'setname': EEG.setname, 'filename': EEG.filename, 'filepath': EEG.filepath, 'srate': float(EEG.srate), 'chanlabels': list(EEG.chanlabels), 'trials': int(EEG.trials), 'dropped': int(EEG.dropped), 'history': list(EEG.history)}
+        partial = '.%d.partial' % (os.getpid())
+        numpy.save(datafile + partial + '.npy', EEG.data)
+        os.replace(datafile + partial + '.npy', datafile)
+        numpy.savez(arrayfile + partial + '.npz', **arrays)
+        os.replace(arrayfile + partial + '.npz', arrayfile)
+        headerhandle = open(headerfile + partial, 'w')
+        json.dump(header, headerhandle)
+        headerhandle.close()
+        os.replace(headerfile + partial, headerfile)
+        self.evict()
+
+    def size(self):
+        """Returns the size of the cache in megabytes
+        """
+        return sum([entry[2] for entry in self._entries()]) / 1048576.0
+
+    def _entries(self):
+        # (last used, key, bytes) of every entry
+        entries = {}
+        for filename in os.listdir(self.folder):
+            key, extension = os.path.splitext(filename)
+            if (extension not in ['.npy', '.npz', '.json']) or ('.' in key):
+                continue # other files, or entries still being written
+            try:
+                stat = os.stat(os.path.join(self.folder, filename))
+            except OSError:
+                continue
+            used, total = entries.get(key, (0.0, 0))
+            entries[key] = (max(used, stat.st_mtime), total + stat.st_size)
+        return [(entries[key][0], key, entries[key][1]) for key in entries]
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in maxsize
+        """
+        entries = sorted(self._entries())
+        total = sum([entry[2] for entry in entries])
+        limit = self.maxsize * 1048576.0
+        for used, key, bytecount in entries:
+            if (total <= limit):
+                break
+            for filename in reversed(self._paths(key)):
+                try:
+                    os.remove(filename)
+                except OSError:
+                    pass
+            total = total - bytecount
+            if self.printoutput:
+                print('EEGCache: removed %s (%.1f MB).' % (key, bytecount / 1048576.0))
+
+    def clear(self):
+        for used, key, bytecount in self._entries():
+            for filename in self._paths(key):
+                try:
+                    os.remove(filename)
+                except OSError:
+                    pass
+
+def _recordingfiles(basename):
+    # every file of a session that readUnicornBlack can read from
+    return [basename + extension for extension in ['.csv', '.csve', '.bin', '.bine', '.json', '.psydat'] if os.path.isfile(basename + extension)]
+
+def runpipeline(inputfile, Pipeline = None, ReadArguments = None, CacheFolder = None, CacheSize = 2048, PrintOutput = False):
+    """Reads a recording and applies a pipeline, starting from the longest cached prefix
+
+    inputfile       --  recording or .psydat name, with or without extension
+    Pipeline        --  list of (function name, keyword arguments) applied after readUnicornBlack,
+                        VEPPipeline if None
+    CacheFolder     --  folder of the EEGCache, eegpipe_cache next to the recording if None,
+                        False to run without a cache
+    CacheSize       --  megabytes kept in the cache
+    PrintOutput     --  report cache resumes and evictions
+    """
+    if Pipeline is None:
+        Pipeline = VEPPipeline
+    if ReadArguments is None:
+        ReadArguments = {}
+    basename, extension = os.path.splitext(inputfile)
+    if extension.lower() not in ['.csv', '.csve', '.bin', '.bine', '.json', '.psydat']:
+        basename = inputfile
+    if CacheFolder is False:
+        EEG = readUnicornBlack(basename, **ReadArguments)
+        for functionname, arguments in Pipeline:
+            EEG = globals()[functionname](EEG, **arguments)
+        return EEG
+
+    if CacheFolder is None:
+        CacheFolder = os.path.join(os.path.dirname(basename), 'eegpipe_cache')
+    cache = EEGCache(CacheFolder, CacheSize)
+    cache.printoutput = PrintOutput
+    keys = [cache.recordingkey(_recordingfiles(basename), ReadArguments)]
+    for functionname, arguments in Pipeline:
+        keys.append(cache.stepkey(keys[-1], functionname, arguments))
+
+    EEG = None
+    start = len(keys)
+    while (start > 0) and (EEG is None):
+        start = start - 1
+        if cache.contains(keys[start]):
+            EEG = cache.get(keys[start])
+    if EEG is None:
+        EEG = readUnicornBlack(basename, **ReadArguments)
+        cache.put(keys[0], EEG)
+        start = 0
+    elif PrintOutput:
+        print('runpipeline(): %s resumed from the cache after %d of %d steps.' % (os.path.basename(basename), start, len(Pipeline)))
+    for incrX in range(start, len(Pipeline)):
+        functionname, arguments = Pipeline[incrX]
+        EEG = globals()[functionname](EEG, **arguments)
+        cache.put(keys[incrX + 1], EEG)
+    return EEG
+
+def findrecordings(InputFolder):
+    """Returns the basename of every recording in a folder with the files that belong to it
+
+    each entry is (basename, [recording, events, behavior files that exist])
+    """
+    recordings = []
+    for filename in sorted(os.listdir(InputFolder)):
+        name, extension = os.path.splitext(filename)
+        if name.endswith('_eegpipe') or name.startswith('eegpipe_'):
+            continue
+        if (extension.lower() == '.csv') or ((extension.lower() == '.json') and os.path.isfile(os.path.join(InputFolder, name + '.bin'))):
+            basename = os.path.join(InputFolder, name)
+            files = [os.path.join(InputFolder, filename)]
+            for extra in ['.bin', '.csve', '.bine', '.psydat']:
+                if os.path.isfile(basename + extra):
+                    files.append(basename + extra)
+            recordings.append((basename, files))
+    return recordings
+
+def _pipelinekey(Pipeline, ReadArguments):
+    # hash of every step name and its arguments, so a changed step invalidates the saved sets
+    digest = hashlib.sha1()
+    digest.update(json.dumps(ReadArguments, sort_keys=True, default=str).encode())
+    for functionname, arguments in Pipeline:
+        digest.update(functionname.encode())
+        digest.update(json.dumps(arguments, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+def _uptodate(basename, files, pipelinekey):
+    # the saved set is newer than every file it was made from, and was made by the same pipeline
+    outputfile = '%s_eegpipe.npz' % (basename)
+    if not os.path.isfile(outputfile) or not os.path.isfile('%s_eegpipe.json' % (basename)):
+        return False
+    if (os.path.getmtime(outputfile) <= max([os.path.getmtime(filename) for filename in files])):
+        return False
+    try:
+        headerfile = open('%s_eegpipe.json' % (basename), 'r')
+        header = json.load(headerfile)
+        headerfile.close()
+    except (IOError, OSError, ValueError):
+        return False
+    return (header.get('pipeline') == pipelinekey)
+
+def _batchworker(basename, Pipeline, ReadArguments, CacheFolder, CacheSize):
+    # runs in a worker process, returns (basename, status), the parent does all the reporting
+    try:
+        EEG = runpipeline(basename, Pipeline, ReadArguments, CacheFolder, CacheSize)
+        EEG.pipeline = _pipelinekey(Pipeline, ReadArguments)
+        saveset(EEG, basename)
+        return (basename, 'processed')
+    except Exception as error:
+        return (basename, 'failed: %s' % (str(error)))
+
+def batchprocess(InputFolder, Pipeline = None, Workers = None, Force = False, GroupFile = None, MeasureWindow = None, ReadArguments = None, CacheFolder = None, CacheSize = 2048, PrintOutput = False):
+    """Runs a pipeline over every recording in a folder with a pool of worker processes
+
+    the workers are started with a ProcessPoolExecutor, which imports the calling script again
+    in every worker on Windows, so call batchprocess from inside an if __name__ == '__main__': block
+
+    InputFolder     --  folder holding the recordings (for example Raw)
+    Pipeline        --  list of (function name, keyword arguments) applied after readUnicornBlack,
+                        VEPPipeline if None
+    Workers         --  worker processes, one per core if None
+    Force           --  reprocess recordings whose saved set is newer than the recording
+    GroupFile       --  csv table of every average, InputFolder/eegpipe_group.csv if None
+    MeasureWindow   --  [start, stop] in milliseconds for the mean amplitude and peak in the
+                        group table, from 0 to the end of the epoch if None
+    CacheFolder     --  folder of the EEGCache shared by the workers, InputFolder/eegpipe_cache
+                        if None, False to run without a cache
+    CacheSize       --  megabytes kept in the cache
+    PrintOutput     --  report the status of each recording as it finishes
+    returns a dictionary of basename and status
+    """
+    if Pipeline is None:
+        Pipeline = VEPPipeline
+    if ReadArguments is None:
+        ReadArguments = {}
+    if GroupFile is None:
+        GroupFile = os.path.join(InputFolder, 'eegpipe_group.csv')
+    if CacheFolder is None:
+        CacheFolder = os.path.join(InputFolder, 'eegpipe_cache')
+
+    status = {}
+    pending = []
+    pipelinekey = _pipelinekey(Pipeline, ReadArguments)
+    for basename, files in findrecordings(InputFolder):
+        if not Force and _uptodate(basename, files, pipelinekey):
+            status[basename] = 'up to date'
+        else:
+            pending.append(basename)
+
+    if (len(pending) > 0):
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=Workers)
+        jobs = [executor.submit(_batchworker, basename, Pipeline, ReadArguments, CacheFolder, CacheSize) for basename in pending]
+        for job in concurrent.futures.as_completed(jobs):
+            basename, result = job.result()
+            status[basename] = result
+            if PrintOutput:
+                print('%s: %s' % (os.path.basename(basename), result))
+        executor.shutdown()
+
+    _grouptable([basename for basename in sorted(status) if not status[basename].startswith('failed')], GroupFile, MeasureWindow)
+    return status
+
+def _grouptable(basenames, GroupFile, MeasureWindow):
+    # one row per recording and event type, with the mean amplitude and peak of each channel
+    rows = []
+    chanlabels = []
+    for basename in basenames:
+        try:
+            EEG = loadset(basename)
+        except (IOError, OSError, ValueError):
+            continue
+        if (getattr(EEG, 'erp', None) is None):
+            continue
+        chanlabels = list(EEG.chanlabels)
+        window = MeasureWindow
+        if window is None:
+            window = [0.0, float(EEG.times[-1])]
+        index = _windowindex(EEG, window)
+        meanamplitude = numpy.mean(EEG.erp[..., index], axis=-1)
+        peak = numpy.argmax(EEG.erp[..., index], axis=-1)
+        for incrX, eventtype in enumerate(EEG.erptypes):
+            row = [EEG.setname, int(eventtype), int(EEG.erpcounts[incrX]), len(EEG.rejected), int(EEG.dropped)]
+            for incrC in range(len(chanlabels)):
+                row.append('%.3f' % meanamplitude[incrX, incrC])
+                row.append('%.3f' % EEG.erp[incrX, incrC, index[peak[incrX, incrC]]])
+                row.append('%.1f' % EEG.times[index[peak[incrX, incrC]]])
+            rows.append(row)
+
+    header = ['Setname', 'Type', 'Epochs', 'Rejected', 'Dropped']
+    for label in chanlabels:
+        header = header + ['%s_Mean' % label, '%s_Peak' % label, '%s_Latency' % label]
+    outputfile = open(GroupFile, 'w', newline='')
+    writer = csv.writer(outputfile)
+    writer.writerow(header)
+    writer.writerows(rows)
+    outputfile.close()
+
+
+# # # # #
+# DEBUG #
+if __name__ == "__main__":
+
+    EEG = readUnicornBlack(os.path.join('..', '..', 'Raw', 'example626.psydat'))
+    print('%d channels, %d points, event types %s' % (EEG.data.shape[0], EEG.data.shape[1], str(numpy.unique(EEG.events['type']))))
+    EEG = simplefilter(EEG, Filter = 'Notch', Cutoff = [60.0])
+    EEG = simplefilter(EEG, Filter = 'Bandpass', Design = 'Butter', Cutoff = [1.0, 25.0], Order = 3)
+    EEG = simpleepoch(EEG, Window = [-200.0, 1000.0], Types = [10006, 10008, 10010, 10012])
+    EEG = simplebaselinecorrect(EEG, Window = [-100.0, 0.0])
+    EEG = voltagethreshold(EEG, Threshold = [-100.0, 100.0], Step = 50.0, PrintOutput = True)
+    EEG = simpleaverage(EEG, Approach = 'Mean', BaselineWindow = [-100.0, 0.0])
+    print('Averages for %s from %s epochs' % (str(EEG.erptypes), str(EEG.erpcounts)))
@@ -7,6 +7,14 @@ UnicornBlackProcess provides the ability to run the device as a seperate process
 
 UnicornBlackCheckSignal provides a class to evaluate signal quality
 
+UnicornBlackQualityHistory keeps the signal quality of each channel over the session
+
+UnicornBlackWriter writes chunks to a recording file from its own thread
+
+UnicornBlackAccumulator collects samples into preallocated chunks for the writer
+
+UnicornBinaryToCSV converts a binary recording into the .csv and .csve layout
+
 
 Working notes
 - Sometimes works when run in Spyder, but seems to work best when run in external
@@ -17,17 +25,37 @@ Working notes
 
 import os
 import math
+import json
+import itertools
 import numpy
 import time
+import queue
 from datetime import datetime
 from threading import Thread, Lock
 from multiprocessing import Queue
 import multiprocessing
-import matplotlib.mlab as mlab
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None # python 3.7 or earlier, data is passed through a pipe instead
 import scipy.signal
+try:
+    import unicornhybridblackstream as unicornhybridblackstream
+except:
+    import Engine.unicornhybridblackstream as unicornhybridblackstream
+try:
+    import unicornhybridblackreader as unicornhybridblackreader
+except:
+    import Engine.unicornhybridblackreader as unicornhybridblackreader
 
 # DEBUG #
-if __name__ == "__main__":
+if os.environ.get('UNICORN_SIMULATOR', '') not in ['', '0']:
+    # software device for testing without the hardware (see unicornpysimulator)
+    try:
+        import unicornpysimulator as UnicornPy
+    except:
+        import Engine.unicornpysimulator as UnicornPy
+elif __name__ == "__main__":
     try:
         import UnicornPy as UnicornPy
     except:
@@ -39,6 +67,22 @@ else:
         import UnicornPy as UnicornPy
 
 
+UnicornBlackCollectVersion = '2020.05.30.0' # written to the header of every recording
+
+# binary event table, defined with the reader so recording, stream, and reader share one layout
+UnicornBlackEventType = unicornhybridblackreader.UnicornBlackEventType
+
+def UnicornBlackEventCode(event):
+    # function to return an event marker as the integer code kept in the event table
+    # integers, whole number floats, and numeric strings such as '12' are accepted
+    try:
+        code = float(event)
+    except (TypeError, ValueError):
+        raise ValueError("Event marker %r is not a numeric code." % (event,))
+    if (not code.is_integer()) or (code < -2147483648) or (code > 2147483647):
+        raise ValueError("Event marker %r is not a whole number code that fits the event table." % (event,))
+    return int(code)
+
 
 class UnicornBlackCheckSignal():
     
@@ -61,105 +105,458 @@ class UnicornBlackCheckSignal():
         self.data = []
         self.psdonfiltereddata = True
         
+        # causal streaming mode: only samples newer than the last check are filtered
+        self.streaming = False
+        self.streamingpsd = False # True to also refresh psddata and psdclean, which costs a full window PSD on every check
+        self.countercolumn = 15 # sample counter column used to find new samples
+        self._stream = None
+        self.history = None # UnicornBlackQualityHistory that every check is added to
+        
     def check(self):
-        self.freqratio = []
-        self.pointstd = []
-        self.filtereddata = []
-        self.psddata = []
-        self.psdclean = []
-        self.freqdata = []
+        # all channels are filtered and transformed together as a (samples x channels) matrix
+        if self.streaming:
+            self._check_streaming()
+            self._record()
+            return
+        
         #start = time.perf_counter()
-        for cP in range(self.nbchan):
-            signalnoiseratio, signalvariability, datavector, _power, _freqs = UnicornGroomQuality(self.data[:,cP], self.controlband, self.noiseband, self._samplefreq, self.scale, self.highpassfilter, self.lowpassfilter, self.notchfilter)
-            self.freqratio.append(signalnoiseratio)
-            self.pointstd.append(signalvariability)
-            self.filtereddata.append(datavector)
-            self.psddata.append(_power)
-            self.freqdata.append(_freqs)
-            if self.psdonfiltereddata:
-                _power, _freqs = UnicornGroomPSD(datavector, self._samplefreq, self.scale)
-                self.psdclean.append(_power)
-            #print('channel %d noise ratio: %0.2f' % (cP, signalnoiseratio))
-            #print('channel %d variance: %0.2f' % (cP, signalvariability))
+        datamatrix = numpy.asarray(self.data)[:,0:self.nbchan]
+        signalnoiseratio, signalvariability, datamatrix, _power, _freqs = UnicornGroomQualityMatrix(datamatrix, self.controlband, self.noiseband, self._samplefreq, self.scale, self.highpassfilter, self.lowpassfilter, self.notchfilter)
+        self.freqratio = signalnoiseratio.tolist()
+        self.pointstd = signalvariability.tolist()
+        self.filtereddata = numpy.transpose(datamatrix) # channels x samples
+        self.psddata = numpy.transpose(_power) # channels x frequencies
+        self.freqdata = [_freqs] * self.nbchan
+        self.psdclean = []
+        if self.psdonfiltereddata:
+            _power, _freqs = UnicornGroomPSDMatrix(datamatrix, self._samplefreq, self.scale)
+            self.psdclean = numpy.transpose(_power)
+        self._record()
         #finish = time.perf_counter()
         #print(f'Finished in {round(finish-start,8)} seconds(s)')
         
+    def _record(self):
+        if self.history is not None:
+            self.history.add(self.pointstd, self.freqratio)
+            
+    def track(self, source, interval=1.0):
+        """Checks the data of source (any object with sample_data()) every interval seconds
+        from a background thread until stop() is called
+        """
+        self.killcheck.clear()
+        self._tthread = Thread(target=self._track, args=[source, interval], daemon=True)
+        self._tthread.name = 'qualitytracker'
+        self._tthread.start()
+        
+    def stop(self):
+        self.killcheck.set()
+        try:
+            self._tthread.join()
+        except AttributeError:
+            pass
+        
+    def track_quality(self, source, channellabels, interval=1.0, length=3600):
+        """Tracks source into a new UnicornBlackQualityHistory of the labelled channels,
+        returns the history so thresholds and callbacks can be set
+        """
+        self.nbchan = len(channellabels)
+        self.history = UnicornBlackQualityHistory(nbchan=self.nbchan, length=length, channellabels=channellabels)
+        self.track(source, interval)
+        return self.history
+        
+    def check_quality(self, printoutput=False):
+        """Returns the signal quality history summary, see UnicornBlackQualityHistory.check_quality
+        """
+        if self.history is None:
+            return {'checks': 0, 'degraded': {}}
+        quality = self.history.check_quality()
+        if printoutput and (len(quality['degraded']) > 0):
+            print('Degraded channels: %s' % ', '.join(['%s (%s)' % (channel, ', '.join(quality['degraded'][channel])) for channel in quality['degraded']]))
+        return quality
+        
+    def _track(self, source, interval):
+        while not self.killcheck.wait(interval):
+            sampledata = numpy.array(source.sample_data(), copy=True)
+            sampledata = sampledata[sampledata[:,self.countercolumn] > 0,:] # rows not filled yet hold zeros
+            if (sampledata.shape[0] > (self._samplefreq * 2.0)):
+                self.data = sampledata
+                self.check()
+        
+    def reset_stream(self):
+        # discard the streaming filter state, the next check will prime it again from the full window
+        self._stream = None
+        
+    def _start_stream(self, windowlength):
+        stream = {}
+        sections = []
+        if not (float(self.notchfilter) == float(0.0)):
+            sections.append(UnicornGroomSOS(self._samplefreq, ('notch', float(self.notchfilter))))
+        band = UnicornGroomBand(self.highpassfilter, self.lowpassfilter)
+        if band is not None:
+            sections.append(UnicornGroomSOS(self._samplefreq, band, 3))
+        stream['sos'] = None
+        if (len(sections) > 0):
+            stream['sos'] = numpy.vstack(sections)
+        stream['controlsos'] = UnicornGroomSOS(self._samplefreq, ('bandpass', float(self.controlband[0]), float(self.controlband[1])), 3)
+        stream['noisesos'] = UnicornGroomSOS(self._samplefreq, ('bandpass', float(self.noiseband[0]), float(self.noiseband[1])), 3)
+        stream['zi'] = None
+        stream['controlzi'] = None
+        stream['noisezi'] = None
+        
+        # exponential weighting over about the last fifth of the window, the same span used in batch mode
+        stream['decay'] = math.exp(-1.0 / max(math.floor(windowlength / 5.0), 1))
+        stream['mean'] = numpy.zeros(self.nbchan)
+        stream['meansquare'] = numpy.zeros(self.nbchan)
+        stream['controlpower'] = numpy.zeros(self.nbchan)
+        stream['noisepower'] = numpy.zeros(self.nbchan)
+        stream['filtered'] = UnicornBlackRingBuffer(windowlength, self.nbchan)
+        stream['lastcounter'] = None
+        self._stream = stream
+        
+    def _stream_filter(self, sos, zi, newdata):
+        # causal filter that carries its state (zi) from one block of samples to the next
+        if sos is None:
+            return newdata, zi
+        if zi is None:
+            zi = scipy.signal.sosfilt_zi(sos)[:,:,numpy.newaxis] * newdata[0,:] # start from steady state at the first sample
+        return scipy.signal.sosfilt(sos, newdata, axis=0, zi=zi)
+    
+    def _stream_average(self, average, newdata):
+        # exponentially weighted average of each column updated with a block of new samples
+        decay = self._stream['decay']
+        weights = decay ** numpy.arange(newdata.shape[0] - 1, -1, -1)
+        return (average * (decay ** newdata.shape[0])) + ((1.0 - decay) * numpy.dot(weights, newdata))
+        
+    def _check_streaming(self):
+        datamatrix = numpy.asarray(self.data)
+        if (self._stream is None) or (self._stream['filtered'].rows != datamatrix.shape[0]):
+            self._start_stream(datamatrix.shape[0])
+        stream = self._stream
+        
+        # find the samples that arrived since the last check
+        newrows = datamatrix
+        if (datamatrix.shape[1] > self.countercolumn):
+            counters = datamatrix[:,self.countercolumn]
+            if stream['lastcounter'] is not None:
+                if (counters[-1] < stream['lastcounter']):
+                    # the counter went backwards so the stream restarted
+                    self._start_stream(datamatrix.shape[0])
+                    stream = self._stream
+                else:
+                    newrows = datamatrix[counters > stream['lastcounter'],:]
+            stream['lastcounter'] = float(counters[-1])
+        newrows = numpy.asarray(newrows[:,0:self.nbchan], dtype=numpy.float64)
+        
+        if (newrows.shape[0] > 0):
+            filtered, stream['zi'] = self._stream_filter(stream['sos'], stream['zi'], newrows)
+            controlband, stream['controlzi'] = self._stream_filter(stream['controlsos'], stream['controlzi'], newrows)
+            noiseband, stream['noisezi'] = self._stream_filter(stream['noisesos'], stream['noisezi'], newrows)
+            
+            stream['filtered'].push(filtered)
+            stream['mean'] = self._stream_average(stream['mean'], filtered)
+            stream['meansquare'] = self._stream_average(stream['meansquare'], filtered ** 2)
+            stream['controlpower'] = self._stream_average(stream['controlpower'], controlband ** 2)
+            stream['noisepower'] = self._stream_average(stream['noisepower'], noiseband ** 2)
+        
+        # band power as density so the ratio is comparable to the batch psd ratio
+        controlpower = stream['controlpower'] / float(self.controlband[1] - self.controlband[0])
+        noisepower = stream['noisepower'] / float(self.noiseband[1] - self.noiseband[0])
+        controlpower[controlpower == 0.0] = 0.0001
+        self.freqratio = numpy.around(numpy.divide(noisepower, controlpower), decimals=1).tolist()
+        self.pointstd = numpy.sqrt(numpy.maximum(stream['meansquare'] - (stream['mean'] ** 2), 0.0)).tolist()
+        
+        filteredmatrix = stream['filtered'].snapshot()
+        self.filtereddata = numpy.transpose(filteredmatrix) # channels x samples
+        if self.streamingpsd:
+            _power, _freqs = UnicornGroomPSDMatrix(numpy.asarray(datamatrix[:,0:self.nbchan], dtype=numpy.float64), self._samplefreq, self.scale)
+            self.psddata = numpy.transpose(_power)
+            self.freqdata = [_freqs] * self.nbchan
+            self.psdclean = []
+            if self.psdonfiltereddata:
+                _power, _freqs = UnicornGroomPSDMatrix(filteredmatrix, self._samplefreq, self.scale)
+                self.psdclean = numpy.transpose(_power)
+        
+
+class UnicornBlackQualityHistory():
+    """signal quality of each channel over the session, kept in a ring array
+    
+    every check adds one row with the time, pointstd, and freqratio of each channel. Rolling
+    trends (change per minute over the last trendspan seconds) show an electrode drying out or
+    line noise creeping in before the values cross a threshold. Functions registered with
+    add_callback are called as callback(channel, reason, value) once a channel has been
+    degraded for persistence checks in a row
+        'pointstd'          variability at or above the degradedlevel bin of pointstdthresholds
+        'freqratio'         line noise ratio above freqratiothreshold
+        'pointstdtrend'     variability rising faster than pointstdtrendthreshold per minute
+        'freqratiotrend'    line noise ratio rising faster than freqratiotrendthreshold per minute
+    """
+    
+    def __init__(self, nbchan=8, length=3600, channellabels=None):
+        self.nbchan = int(nbchan)
+        self.length = int(length) # checks kept
+        self.channellabels = channellabels # callbacks and check_quality use labels if provided
+        self.pointstdthresholds = [12, 16, 30, 60] # microvolts, the viewer label color bins
+        self.degradedlevel = 3 # bin of pointstdthresholds from which a channel is degraded
+        self.freqratiothreshold = None # None to skip
+        self.pointstdtrendthreshold = 5.0 # microvolts per minute, None to skip
+        self.freqratiotrendthreshold = None # ratio per minute, None to skip
+        self.trendspan = 60.0 # seconds
+        self.persistence = 3 # consecutive degraded checks before the callbacks are called
+        self.callbacks = []
+        self._lock = Lock() # guards data, degraded, and the counts between the checking thread and readers
+        self.reset()
+        
+    def reset(self):
+        self._lock.acquire(True)
+        self.data = UnicornBlackRingBuffer(self.length, 1 + (2 * self.nbchan)) # time, pointstd of each channel, freqratio of each channel
+        self.degraded = {} # reasons each channel is currently degraded
+        self._counts = {} # consecutive degraded checks for each (channel, reason)
+        self._start = time.perf_counter()
+        self._lock.release()
+        
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+        
+    def _channel(self, channel):
+        if self.channellabels is not None:
+            return self.channellabels[channel]
+        return channel
+        
+    def add(self, pointstd, freqratio, timestamp=None):
+        """Adds the result of one check, timestamp is time.perf_counter() if None
+        """
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        row = numpy.zeros(1 + (2 * self.nbchan))
+        row[0] = timestamp - self._start
+        row[1:(1 + self.nbchan)] = numpy.asarray(pointstd, dtype=float)[0:self.nbchan]
+        row[(1 + self.nbchan):] = numpy.asarray(freqratio, dtype=float)[0:self.nbchan]
+        self._lock.acquire(True)
+        self.data.push(row)
+        fired = self._evaluate()
+        self._lock.release()
+        for channel, reason, value in fired:
+            for callback in self.callbacks:
+                callback(channel, reason, value) # outside the lock so callbacks can read the history
+        
+    def history(self, span=None):
+        """Returns (times, pointstd, freqratio) arrays of the kept checks, oldest first
+        
+        times are seconds since the history was started, the others are (checks x channels)
+        span        --  only the last span seconds if provided
+        """
+        self._lock.acquire(True)
+        history = self._history(span)
+        self._lock.release()
+        return history
+        
+    def _history(self, span=None):
+        # caller holds the lock
+        rows = self.data.snapshot()[-min(self.data.count, self.length):,:] if (self.data.count > 0) else numpy.zeros((0, self.data.channels), dtype=numpy.float32)
+        rows = numpy.asarray(rows, dtype=float)
+        if (span is not None) and (rows.shape[0] > 0):
+            rows = rows[rows[:,0] >= (rows[-1,0] - span),:]
+        return rows[:,0], rows[:,1:(1 + self.nbchan)], rows[:,(1 + self.nbchan):]
+        
+    def trend(self, span=None):
+        """Returns the least squares change per minute of (pointstd, freqratio) for each channel
+        over the last span seconds (trendspan if None)
+        """
+        if span is None:
+            span = self.trendspan
+        return self._trend(*self.history(span))
+        
+    def _trend(self, times, pointstd, freqratio):
+        if (len(times) < 3) or (numpy.ptp(times) == 0.0):
+            return numpy.zeros(self.nbchan), numpy.zeros(self.nbchan)
+        centered = times - numpy.mean(times)
+        denominator = numpy.sum(centered ** 2) / 60.0
+        return numpy.dot(centered, pointstd - numpy.mean(pointstd, axis=0)) / denominator, numpy.dot(centered, freqratio - numpy.mean(freqratio, axis=0)) / denominator
+        
+    def quality_bins(self, pointstd=None):
+        """Returns the bin of pointstdthresholds for each channel, 0 is best
+        """
+        if pointstd is None:
+            pointstd = self.history()[1]
+            if (pointstd.shape[0] == 0):
+                return numpy.zeros(self.nbchan, dtype=int)
+            pointstd = pointstd[-1,:]
+        return numpy.searchsorted(self.pointstdthresholds, pointstd, side='right')
+        
+    def _evaluate(self):
+        # counts consecutive degraded checks, returns the degradations to report once each
+        # caller holds the lock
+        times, pointstd, freqratio = self._history(self.trendspan)
+        pointstdtrend, freqratiotrend = self._trend(times, pointstd, freqratio)
+        conditions = {'pointstd': (self.quality_bins(pointstd[-1,:]) >= self.degradedlevel, pointstd[-1,:])}
+        if self.freqratiothreshold is not None:
+            conditions['freqratio'] = (freqratio[-1,:] > self.freqratiothreshold, freqratio[-1,:])
+        if (self.pointstdtrendthreshold is not None) and (times[-1] - times[0] >= (self.trendspan / 2.0)):
+            conditions['pointstdtrend'] = (pointstdtrend > self.pointstdtrendthreshold, pointstdtrend)
+        if (self.freqratiotrendthreshold is not None) and (times[-1] - times[0] >= (self.trendspan / 2.0)):
+            conditions['freqratiotrend'] = (freqratiotrend > self.freqratiotrendthreshold, freqratiotrend)
+        
+        fired = []
+        for reason in conditions:
+            degraded, values = conditions[reason]
+            for cC in range(self.nbchan):
+                channel = self._channel(cC)
+                if degraded[cC]:
+                    self._counts[(cC, reason)] = self._counts.get((cC, reason), 0) + 1
+                    if (self._counts[(cC, reason)] == self.persistence):
+                        self.degraded.setdefault(channel, []).append(reason)
+                        fired.append((channel, reason, float(values[cC])))
+                else:
+                    self._counts[(cC, reason)] = 0
+                    if reason in self.degraded.get(channel, []):
+                        self.degraded[channel].remove(reason) # recovered
+                        if (len(self.degraded[channel]) == 0):
+                            del self.degraded[channel]
+        return fired
+        
+    def degraded_channels(self):
+        """Returns a copy of the reasons each channel is currently degraded
+        """
+        self._lock.acquire(True)
+        degraded = dict([(channel, list(self.degraded[channel])) for channel in self.degraded])
+        self._lock.release()
+        return degraded
+                
+    def check_quality(self):
+        """Returns the latest values, trends, bins, and degraded channels
+        """
+        self._lock.acquire(True)
+        times, pointstd, freqratio = self._history()
+        checks = int(self.data.count)
+        degraded = dict([(channel, list(self.degraded[channel])) for channel in self.degraded])
+        self._lock.release()
+        if (len(times) == 0):
+            return {'checks': 0, 'degraded': {}}
+        pointstdtrend, freqratiotrend = self._trend(*[values[times >= (times[-1] - self.trendspan)] for values in (times, pointstd, freqratio)])
+        bins = self.quality_bins(pointstd[-1,:])
+        quality = {'checks': checks, 'time': float(times[-1]), 'channels': {}, 'degraded': degraded}
+        for cC in range(self.nbchan):
+            quality['channels'][self._channel(cC)] = {'pointstd': float(pointstd[-1,cC]), 'freqratio': float(freqratio[-1,cC]), 'pointstdtrend': float(pointstdtrend[cC]), 'freqratiotrend': float(freqratiotrend[cC]), 'bin': int(bins[cC])}
+        return quality
+        
+
+# filter designs are reused across calls, keyed by (samplefreq, band, order)
+_UnicornGroomSOSCache = {}
+
+def UnicornGroomSOS(samplefreq, band, order=3):
+    # function to return second order sections for a filter, designing it only the first time
+    # band is ('notch', frequency), ('bandpass', low, high), ('highpass', cutoff), or ('lowpass', cutoff)
+    key = (float(samplefreq), tuple(band), int(order))
+    if key not in _UnicornGroomSOSCache:
+        if (band[0] == 'notch'):
+            b, a = scipy.signal.iirnotch(band[1], 30.0, samplefreq) # Design notch filter
+            sos = scipy.signal.tf2sos(b, a)
+        elif (band[0] == 'bandpass'):
+            sos = scipy.signal.iirfilter(order, [band[1], band[2]], btype='bandpass', ftype='butter', fs=samplefreq, output='sos')
+        else:
+            sos = scipy.signal.iirfilter(order, band[1], btype=band[0], ftype='butter', fs=samplefreq, output='sos')
+        _UnicornGroomSOSCache[key] = sos
+    return _UnicornGroomSOSCache[key]
+
+def UnicornGroomBand(highpassfilter=0.1, lowpassfilter=20.0):
+    # function to return the butterworth band for the requested cutoffs, or None if no filtering is requested
+    if not (float(highpassfilter) == float(0.0)):
+        if not (float(lowpassfilter) == float(0.0)):
+            return ('bandpass', float(highpassfilter), float(lowpassfilter))
+        return ('highpass', float(highpassfilter))
+    elif not (float(lowpassfilter) == float(0.0)):
+        return ('lowpass', float(lowpassfilter))
+    return None
 
 def UnicornGroomPSD(datavector, samplefreq=250.0, scale=500):
     #print('UnicornGroomPSD: called')
     # function to obtain spectral power
-    overlaplength = int(len(datavector)/3.0)
+    _power, _freqs = UnicornGroomPSDMatrix(numpy.ravel(datavector), samplefreq=samplefreq, scale=scale)
+    return _power, _freqs
+    #print('UnicornGroomPSD: complete')
+
+def UnicornGroomPSDMatrix(datamatrix, samplefreq=250.0, scale=500):
+    # function to obtain spectral power for every column of a (samples x channels) matrix in one call
+    # matches mlab.psd: hanning window, no detrending, zero padded to scale points, onesided density
+    overlaplength = int(datamatrix.shape[0]/3.0)
     if (int(scale) <= overlaplength):
         overlaplength = int(int(scale)/2.0)
+    segmentlength = min(int(scale), datamatrix.shape[0])
+    overlaplength = min(overlaplength, segmentlength - 1)
     
-    _power = []
-    _freqs = []
-    _power, _freqs = mlab.psd(x=datavector, NFFT=int(scale), Fs=samplefreq, noverlap=overlaplength, sides='onesided', scale_by_freq=True)
+    _freqs, _power = scipy.signal.welch(datamatrix, fs=samplefreq, window=numpy.hanning(segmentlength), nperseg=segmentlength, noverlap=overlaplength, nfft=int(scale), detrend=False, return_onesided=True, scaling='density', axis=0)
     return _power, _freqs
-    #print('UnicornGroomPSD: complete')
 
 def UnicornGroomFilter(datavector, highpassfilter=0.1, lowpassfilter=20.0, notchfilter=60.0, samplefreq=250.0):
     #print('UnicornGroomFilter: called')
     # function to return filtered data
+    return UnicornGroomFilterMatrix(datavector, highpassfilter=highpassfilter, lowpassfilter=lowpassfilter, notchfilter=notchfilter, samplefreq=samplefreq)
+    #print('UnicornGroomFilter: complete')
+
+def UnicornGroomFilterMatrix(datamatrix, highpassfilter=0.1, lowpassfilter=20.0, notchfilter=60.0, samplefreq=250.0):
+    # function to return zero phase filtered data, filtering along the time axis of a (samples x channels) matrix
         
     # Apply notch filter
     if not (float(notchfilter) == float(0.0)):
-        b, a = scipy.signal.iirnotch(notchfilter, 30.0, samplefreq) # Design notch filter
-        datavector = scipy.signal.filtfilt(b=b, a=a, x=datavector, padtype='constant', padlen=int(math.floor(len(datavector)/3.0)), method="pad") 
-    
-    continuefilt = False
-    if not (float(highpassfilter) == float(0.0)):
-        if not (float(lowpassfilter) == float(0.0)):
-            # band pass
-            b, a = scipy.signal.iirfilter(3, [highpassfilter, lowpassfilter], btype='bandpass', ftype='butter', fs=samplefreq, output='ba')
-            #sos = scipy.signal.iirfilter(3, [highpassfilter, lowpassfilter], btype='bandpass', ftype='butter', fs=samplefreq, output='sos')
-            continuefilt = True
-        else:
-            # high pass
-            b, a = scipy.signal.iirfilter(3, highpassfilter, btype='highpass', ftype='butter', fs=samplefreq, output='ba')
-            #sos = scipy.signal.iirfilter(3, highpassfilter, btype='highpass', ftype='butter', fs=samplefreq, output='sos')
-            continuefilt = True
-    elif not (float(lowpassfilter) == float(0.0)):
-        # low pass
-        b, a = scipy.signal.iirfilter(3, lowpassfilter, btype='lowpass', ftype='butter', fs=samplefreq, output='ba')
-        #sos = scipy.signal.iirfilter(3, lowpassfilter, btype='lowpass', ftype='butter', fs=samplefreq, output='sos')
-        continuefilt = True
+        sos = UnicornGroomSOS(samplefreq, ('notch', float(notchfilter)))
+        datamatrix = scipy.signal.sosfiltfilt(sos, datamatrix, axis=0, padtype='constant', padlen=int(math.floor(datamatrix.shape[0]/3.0)))
     
-    if continuefilt:     
-        #datavector = scipy.signal.filtfilt(b=b, a=a, x=datavector, padtype='constant', padlen=int(math.floor(len(datavector)/3.0)), method="pad") 
-        datavector = scipy.signal.filtfilt(b=b, a=a, x=datavector, padtype=None) 
-        #datavector = scipy.signal.sosfilt(sos, datavector)    
+    band = UnicornGroomBand(highpassfilter, lowpassfilter)
+    if band is not None:
+        sos = UnicornGroomSOS(samplefreq, band, 3)
+        datamatrix = scipy.signal.sosfiltfilt(sos, datamatrix, axis=0, padtype=None)
         
-    return datavector
-    #print('UnicornGroomFilter: complete')
+    return datamatrix
 
 def UnicornGroomQuality(datavector, controlband, noiseband, samplefreq, scale, highpassfilter, lowpassfilter, notchfilter):
     # function to evaluate quality of signal
-    signalnoiseratio = []
-    signalvariability = []
-    
     datavector = numpy.ravel(datavector)
+    signalnoiseratio, signalvariability, datavector, _power, _freqs = UnicornGroomQualityMatrix(numpy.reshape(datavector, (-1, 1)), controlband, noiseband, samplefreq, scale, highpassfilter, lowpassfilter, notchfilter)
+    return signalnoiseratio[0], signalvariability[0], datavector[:,0], _power[:,0], _freqs
 
-    _power, _freqs = UnicornGroomPSD(datavector, samplefreq=samplefreq, scale=scale)
-    controlpower = numpy.median(_power[numpy.argmin(abs(_freqs-(controlband[0]))):numpy.argmin(abs(_freqs-(controlband[1])))])
-    noisepower = numpy.mean(_power[numpy.argmin(abs(_freqs-(noiseband[0]))):numpy.argmin(abs(_freqs-(noiseband[1])))])
+def UnicornGroomQualityMatrix(datamatrix, controlband, noiseband, samplefreq, scale, highpassfilter, lowpassfilter, notchfilter):
+    # function to evaluate quality of signal for every column of a (samples x channels) matrix
+    datamatrix = numpy.asarray(datamatrix, dtype=numpy.float64)
 
-    if (float(controlpower) == float(0.0)):
-        controlpower = 0.0001
+    _power, _freqs = UnicornGroomPSDMatrix(datamatrix, samplefreq=samplefreq, scale=scale)
+    controlpower = numpy.median(_power[numpy.argmin(abs(_freqs-(controlband[0]))):numpy.argmin(abs(_freqs-(controlband[1]))),:], axis=0)
+    noisepower = numpy.mean(_power[numpy.argmin(abs(_freqs-(noiseband[0]))):numpy.argmin(abs(_freqs-(noiseband[1]))),:], axis=0)
+
+    controlpower[controlpower == 0.0] = 0.0001
                 
     signalnoiseratio = numpy.around(numpy.divide(noisepower, controlpower), decimals=1) # frequency ratio
                          
-    datavector = UnicornGroomFilter(datavector, highpassfilter=highpassfilter, lowpassfilter=lowpassfilter, notchfilter=notchfilter, samplefreq=samplefreq)
+    datamatrix = UnicornGroomFilterMatrix(datamatrix, highpassfilter=highpassfilter, lowpassfilter=lowpassfilter, notchfilter=notchfilter, samplefreq=samplefreq)
     
-    checkspan = int(math.floor((len(datavector) / 5.0))) * -1
-    signalvariability = numpy.std(datavector[checkspan:-1])
+    checkspan = int(math.floor((datamatrix.shape[0] / 5.0))) * -1
+    signalvariability = numpy.std(datamatrix[checkspan:-1,:], axis=0)
     
-    return signalnoiseratio, signalvariability, datavector, _power, _freqs
+    return signalnoiseratio, signalvariability, datamatrix, _power, _freqs
+
 
 
+def UnicornJockeyCounts(UnicornBlack, samplecounts):
+    # publishes the sample and logging accounting of the device to the shared array
+    if UnicornBlack.data is not None:
+        samplecounts[0] = UnicornBlack.data.count
+        samplecounts[1] = UnicornBlack.droppedsamples
+        samplecounts[2] = UnicornBlack.duplicatesamples
+        logcheck = UnicornBlack._logging_status()
+        samplecounts[3] = int(logcheck['cputime'] * 1000000)
+        samplecounts[4] = logcheck['bytes']
+        samplecounts[5] = logcheck['queuedepth']
+        samplecounts[6] = logcheck['bytespending']
+        latestsample = UnicornBlack._latestsample
+        if latestsample is not None:
+            # the counter and arrival pair is guarded by a sequence number like UnicornBlackRingBuffer
+            samplecounts[9] += 1 # odd sequence, write in progress
+            samplecounts[7] = latestsample[0]
+            samplecounts[8] = latestsample[1]
+            samplecounts[9] += 1 # even sequence, write complete
 
-def UnicornJockey(deviceID, channellabels, rollingspan, logfilename, printoutput, startrecordingeeg, eegready, eegrecording, safetologevent, markeeg, markvalue, pulleegdata, conn, stoprecordingeeg):
+def UnicornJockey(deviceID, channellabels, rollingspan, logfilename, printoutput, eegready, eegrecording, conn, framelength, samplecounts, logformat, sharedname, durability, syncinterval):
     # this is the function that gets pushed to a seperate process that actually controls the device
+    # commands arrive over conn as (command, value) tuples, the loop sleeps in poll() until there is work
     
     startedrecording = False
     
@@ -167,38 +564,48 @@ def UnicornJockey(deviceID, channellabels, rollingspan, logfilename, printoutput
     UnicornBlack = UnicornBlackThreads() 
     UnicornBlack.channellabels = channellabels # change channel labels
     UnicornBlack.printoutput = printoutput
-    UnicornBlack.connect(deviceID=deviceID, rollingspan=rollingspan, logfilename=logfilename)
+    UnicornBlack.durability = durability
+    UnicornBlack.syncinterval = syncinterval
+    UnicornBlack.connect(deviceID=deviceID, rollingspan=rollingspan, logfilename=logfilename, framelength=framelength, logformat=logformat, sharedname=sharedname)
+    UnicornJockeyCounts(UnicornBlack, samplecounts)
     eegready.set()
                 
     continueroutine = True
     while continueroutine:
         
-        if markeeg.is_set():
-            UnicornBlack.mark_event(markvalue.value) # Send trigger 
-            markeeg.clear()
+        if conn.poll(0.1): # wait up to 100 ms for a command
+            try:
+                command, value = conn.recv()
+            except EOFError:
+                command, value = 'stop', None # parent has gone away
+            
+            if (command == 'mark'):
+                UnicornBlack.mark_event(value[0], timestamp=value[1]) # Send trigger 
             
-        if not startedrecording:
-            if startrecordingeeg.is_set():
-                UnicornBlack.startrecording() # rename file name here
-                startedrecording = True
-                eegrecording.set()
-    
-        if startedrecording:
-            if stoprecordingeeg.is_set():
+            elif (command == 'safetolog'):
+                UnicornBlack.safe_to_log(value)
+                
+            elif (command == 'pull'):
+                sample = UnicornBlack.sample_data()
+                #print('UnicornJockey: Battery at %0.1f percent' % numpy.array(sample)[-1,-3])
+                conn.send(sample[:])
+                
+            elif (command == 'publish'):
+                conn.send(UnicornBlack.publish(port=value[0], host=value[1], protocol=value[2]))
+                
+            elif (command == 'start'):
+                if not startedrecording:
+                    UnicornBlack.startrecording() # rename file name here
+                    startedrecording = True
+                    UnicornJockeyCounts(UnicornBlack, samplecounts) # counts are current before the parent continues
+                    eegrecording.set()
+                    
+            elif (command == 'stop'):
                 UnicornBlack._safetolog = True # push any remaining items to file
                 UnicornBlack.disconnect()
                 continueroutine = False
-                
-        if safetologevent.is_set():
-            UnicornBlack.safe_to_log(True)
-        else:
-            UnicornBlack.safe_to_log(False)
             
-        if pulleegdata.is_set():
-            sample = UnicornBlack.sample_data()
-            #print('UnicornJockey: Battery at %0.1f percent' % numpy.array(sample)[-1,-3])
-            conn.send(sample[:])
-            pulleegdata.clear()
+        UnicornJockeyCounts(UnicornBlack, samplecounts)
 
 class UnicornBlackProcess():  
     # this will be the class that the user interfaces with that intializes and maintains the multiprocessing
@@ -210,58 +617,95 @@ class UnicornBlackProcess():
         self.ready = False
         self.recording = False
         self.printoutput = False
+        self.sharedmemory = shared_memory is not None # publish the rolling window through shared memory instead of the pipe
+        self._sharedbuffer = None
+        self.durability = 'interval' # interval, trial, chunk, or close (see UnicornBlackWriter)
+        self.syncinterval = 5.0 # seconds between fsync calls for the interval policy
+        self.quality = None # UnicornBlackCheckSignal started by start_quality
         
-    def connect(self, deviceID=None, rollingspan=3.0, logfilename='default'):
+    def connect(self, deviceID=None, rollingspan=3.0, logfilename='default', framelength=1, logformat='csv'):
         # because of the multiprocessing, to not create additional headaches, the file name needs to be initiallized at connect
         
         self.deviceID = deviceID
         self.rollingspan = rollingspan
         self.logfilename = logfilename
+        self.framelength = framelength
+        self.logformat = logformat
         
         # connect to Device
-        self.startrecordingeeg = multiprocessing.Event()
-        self.stoprecordingeeg = multiprocessing.Event()
         self.eegready = multiprocessing.Event()
         self.eegrecording = multiprocessing.Event()
-        self.safetologevent = multiprocessing.Event()
-        self.markeeg = multiprocessing.Event()
-        self.markvalue = multiprocessing.Value('i', 0)
+        self.samplecounts = multiprocessing.Array('q', 10, lock=False) # samples, dropped, duplicate, data writer cpu microseconds, bytes written, writer queue depth, bytes pending, newest counter, newest arrival, clock sequence
         
-        # code to be able to pull data
-        self.pulleegdata = multiprocessing.Event()
-        self.pulleegdata1, self.pulleegdata2 = multiprocessing.Pipe()
+        # single command channel to the acquisition process, also used to pull data
+        self.commandconn1, self.commandconn2 = multiprocessing.Pipe()
+        self._commandlock = Lock()
         
-        self.p = multiprocessing.Process(target=UnicornJockey, args=[self.deviceID, self.channellabels, self.rollingspan, self.logfilename, self.printoutput, self.startrecordingeeg, self.eegready, self.eegrecording, self.safetologevent, self.markeeg, self.markvalue, self.pulleegdata, self.pulleegdata2, self.stoprecordingeeg])
+        # the acquisition process writes its rolling window straight into this block
+        sharedname = None
+        if self.sharedmemory:
+            sharedname = 'unicornblack_%d_%x' % (os.getpid(), id(self))
+            self._sharedbuffer = UnicornBlackRingBuffer(math.floor( float(self.rollingspan) * float(self.samplefreq) ), self.numberOfAcquiredChannels, sharedname=sharedname, create=True)
+        
+        self.p = multiprocessing.Process(target=UnicornJockey, args=[self.deviceID, self.channellabels, self.rollingspan, self.logfilename, self.printoutput, self.eegready, self.eegrecording, self.commandconn2, self.framelength, self.samplecounts, self.logformat, sharedname, self.durability, self.syncinterval])
         self.p.start()
         self.eegready.wait(3.0) # wait up to 3 seconds
         self.ready = True
         
+    def _command(self, command, value=None):
+        # send a command to the acquisition process
+        self._commandlock.acquire(True)
+        self.commandconn1.send((command, value))
+        self._commandlock.release()
+        
     def startrecording(self):
-        self.startrecordingeeg.set()
+        self._command('start')
         self.eegrecording.wait(3.0) # wait up to 3 seconds
         self.recording = True
         
     def disconnect(self):
-        self.stoprecordingeeg.set()
+        if self.quality is not None:
+            self.quality.stop()
+        self._command('stop')
         self.p.join()
-        self.pulleegdata1.close() 
+        self.commandconn1.close() 
+        if self._sharedbuffer is not None:
+            self._sharedbuffer.close(unlink=True)
         
-    def mark_event(self, event):
-        self.markvalue.value = event
-        self.markeeg.set()
+    def mark_event(self, event, timestamp=None):
+        # the timestamp is taken here so the pipe latency does not shift the marker
+        if timestamp is None:
+            timestamp = time.perf_counter_ns()
+        self._command('mark', (UnicornBlackEventCode(event), timestamp)) # invalid markers raise here rather than in the acquisition process
         
     def safe_to_log(self, boolsafe=True):
         """Parameter to change logging settings
         """
-        if boolsafe:
-            self.safetologevent.set()
-        else:
-            self.safetologevent.clear()
+        self._command('safetolog', bool(boolsafe))
+        
+    def publish(self, port=16500, host='127.0.0.1', protocol='tcp'):
+        """Publishes the samples and markers over a network socket from the acquisition process,
+        returns the port the outlet listens on
+        """
+        self._commandlock.acquire(True)
+        self.commandconn1.send(('publish', (port, host, protocol)))
+        port = self.commandconn1.recv()
+        self._commandlock.release()
+        return port
+        
+    def sample_data(self, out=None):
+        if self._sharedbuffer is not None:
+            # consistent time ordered copy read directly from shared memory
+            return self._sharedbuffer.snapshot(out=out)
         
-    def sample_data(self):
         #t = time.perf_counter()
-        self.pulleegdata.set() # tell process to obtain a sample
-        data = self.pulleegdata1.recv() # takes about 20 ms
+        self._commandlock.acquire(True)
+        self.commandconn1.send(('pull', None)) # tell process to obtain a sample
+        data = self.commandconn1.recv() # takes about 20 ms
+        self._commandlock.release()
+        if out is not None:
+            out[:,:] = data
+            data = out
         #print(time.perf_counter() - t)
         #tempdata = numpy.array(data)
         #print('UnicornBlackProcess: Battery at %0.1f percent' % tempdata[-1,-3])
@@ -277,6 +721,320 @@ class UnicornBlackProcess():
         if self.printoutput:
             print('Device battery at %d percent.' % powerlevel)
         return powerlevel
+    
+    def check_samples(self):
+        """Returns the sample counter accounting reported by the acquisition process
+        """
+        samplecheck = {'samples': int(self.samplecounts[0]), 'dropped': int(self.samplecounts[1]), 'duplicate': int(self.samplecounts[2])}
+        if self.printoutput:
+            print('Device streamed %d samples, %d dropped, %d duplicated.' % (samplecheck['samples'], samplecheck['dropped'], samplecheck['duplicate']))
+        return samplecheck
+    
+    def check_logging(self):
+        """Returns the CPU time used by the data writer thread, the bytes it has written,
+        and how much is still waiting to reach the disk
+        """
+        logcheck = {'cputime': float(self.samplecounts[3]) / 1000000.0, 'bytes': int(self.samplecounts[4]), 'queuedepth': int(self.samplecounts[5]), 'bytespending': int(self.samplecounts[6])}
+        if self.printoutput:
+            print('Data writer used %0.3f seconds of CPU time to write %d bytes.' % (logcheck['cputime'], logcheck['bytes']))
+        return logcheck
+
+    def check_clock(self):
+        """Returns the sample counter of the newest sample and its perf_counter_ns() arrival time
+        """
+        while True:
+            sequence = int(self.samplecounts[9])
+            if (sequence % 2 == 0):
+                clock = {'counter': int(self.samplecounts[7]), 'arrival': int(self.samplecounts[8])}
+                if (int(self.samplecounts[9]) == sequence):
+                    return clock # counter and arrival come from the same sample
+            time.sleep(0) # a write is in progress, yield and try again
+
+    def start_quality(self, interval=1.0, length=3600, highpassfilter=1.0, lowpassfilter=26.0):
+        """Checks the signal quality of the EEG channels every interval seconds in the background,
+        see UnicornBlackCheckSignal.track_quality
+        """
+        self.quality = UnicornBlackCheckSignal()
+        self.quality.highpassfilter = highpassfilter
+        self.quality.lowpassfilter = lowpassfilter
+        return self.quality.track_quality(self, [label.strip() for label in self.channellabels.split(',')][0:8], interval=interval, length=length)
+    
+    def check_quality(self):
+        if self.quality is None:
+            return {'checks': 0, 'degraded': {}}
+        return self.quality.check_quality(printoutput=self.printoutput)
+
+class UnicornBlackRingBuffer():
+    """preallocated float32 circular buffer holding the most recent samples
+    
+    rows are written in place at a rolling write index so adding a sample never
+    reallocates, and snapshot() returns the window in time order with a single copy
+    
+    when sharedname is provided the buffer lives in multiprocessing shared memory, so
+    another process can attach to the same name and read snapshots without a round trip.
+    A write sequence number is incremented before and after every push (seqlock), which
+    lets readers detect and retry a snapshot that overlapped with a write.
+    """
+    
+    _stateitems = 4 # sequence, index, count, reserved
+    
+    def __init__(self, rows, channels, sharedname=None, create=False):
+        self.rows = int(rows)
+        self.channels = int(channels)
+        self._shared = None
+        if sharedname is None:
+            self._state = numpy.zeros(self._stateitems, dtype=numpy.int64)
+            self.buffer = numpy.zeros((self.rows, self.channels), dtype=numpy.float32)
+        else:
+            if create:
+                self._shared = shared_memory.SharedMemory(name=sharedname, create=True, size=UnicornBlackRingBuffer.sharedsize(self.rows, self.channels))
+            else:
+                self._shared = shared_memory.SharedMemory(name=sharedname)
+            if (self._shared.size < UnicornBlackRingBuffer.sharedsize(self.rows, self.channels)):
+                raise ValueError('Shared memory block is too small for a %d x %d buffer.' % (self.rows, self.channels))
+            self._state = numpy.ndarray((self._stateitems,), dtype=numpy.int64, buffer=self._shared.buf, offset=0)
+            self.buffer = numpy.ndarray((self.rows, self.channels), dtype=numpy.float32, buffer=self._shared.buf, offset=self._state.nbytes)
+            if create:
+                self._state[:] = 0
+                self.buffer[:,:] = 0.0
+    
+    @staticmethod
+    def sharedsize(rows, channels):
+        # bytes needed for the state header plus the sample buffer
+        return (UnicornBlackRingBuffer._stateitems * 8) + (int(rows) * int(channels) * 4)
+    
+    @property
+    def index(self):
+        return int(self._state[1]) # next row to be written
+    
+    @property
+    def count(self):
+        return int(self._state[2]) # total number of rows ever written
+        
+    def push(self, frame):
+        # frame is a (samples x channels) array
+        frame = numpy.reshape(frame, (-1, self.channels))
+        samples = frame.shape[0]
+        index = int(self._state[1])
+        self._state[0] += 1 # odd sequence, write in progress
+        if (samples >= self.rows):
+            self.buffer[:,:] = frame[-self.rows:,:]
+            index = 0
+        else:
+            stop = index + samples
+            if (stop <= self.rows):
+                self.buffer[index:stop,:] = frame
+            else:
+                split = self.rows - index
+                self.buffer[index:,:] = frame[0:split,:]
+                self.buffer[0:(stop - self.rows),:] = frame[split:,:]
+            index = stop % self.rows
+        self._state[1] = index
+        self._state[2] += samples
+        self._state[0] += 1 # even sequence, write complete
+        
+    def latest(self):
+        # most recently written row (a view, not a copy)
+        return self.buffer[self.index - 1]
+    
+    def snapshot(self, out=None):
+        # contiguous, time ordered copy of the window (oldest row first)
+        # out is an optional (rows x channels) array that is filled in place instead of allocating
+        while True:
+            sequence = int(self._state[0])
+            if (sequence % 2 == 0):
+                index = int(self._state[1])
+                if out is not None:
+                    out[0:(self.rows - index),:] = self.buffer[index:,:]
+                    out[(self.rows - index):,:] = self.buffer[0:index,:]
+                    datasample = out
+                elif (index == 0):
+                    datasample = self.buffer.copy()
+                else:
+                    datasample = numpy.concatenate((self.buffer[index:,:], self.buffer[0:index,:]), axis=0)
+                if (int(self._state[0]) == sequence):
+                    return datasample
+            time.sleep(0) # a write is in progress, yield and try again
+    
+    def close(self, unlink=False):
+        # detach from shared memory, keeping a private copy of the last window
+        if self._shared is not None:
+            self.buffer = self.snapshot()
+            self._state = numpy.array([0, 0, self.count, 0], dtype=numpy.int64)
+            self._shared.close()
+            if unlink:
+                self._shared.unlink()
+            self._shared = None
+    
+
+class UnicornBlackAccumulator():
+    """collects rows into preallocated (rows x channels) chunks
+    
+    rows are copied into place by index so the cost per sample does not depend on how
+    much has been collected. Completed chunks wait in ready until they are handed to the
+    writer without copying, and the writer can return them with recycle() so the storage
+    is reused for the next chunk.
+    
+    rows        --  rows per chunk
+    channels    --  columns per row (None for a one dimensional structured array such as events)
+    dtype       --  numpy dtype of the chunk
+    """
+    
+    def __init__(self, rows, channels=None, dtype=numpy.float32, poolsize=4):
+        self.rows = max(int(rows), 1)
+        self.channels = channels
+        self.dtype = numpy.dtype(dtype)
+        self.ready = [] # completed chunks waiting to be handed off
+        self._poolsize = int(poolsize)
+        self._pool = []
+        self._storage = self._allocate()
+        self._count = 0
+        
+    def __len__(self):
+        return self._count + sum([len(chunk) for chunk in self.ready])
+        
+    def _allocate(self):
+        # reuse returned storage where possible
+        try:
+            return self._pool.pop()
+        except IndexError:
+            if self.channels is None:
+                return numpy.empty(self.rows, dtype=self.dtype)
+            return numpy.empty((self.rows, self.channels), dtype=self.dtype)
+        
+    def append(self, data):
+        """Copies rows into the current chunk, moving it to ready each time it fills
+        """
+        start = 0
+        while (start < len(data)):
+            stop = min(start + (self.rows - self._count), len(data))
+            self._storage[self._count:self._count + (stop - start)] = data[start:stop]
+            self._count = self._count + (stop - start)
+            start = stop
+            if (self._count == self.rows):
+                self.ready.append(self._storage)
+                self._storage = self._allocate()
+                self._count = 0
+                
+    def pop(self):
+        """Returns the completed chunks and forgets them
+        """
+        chunks = self.ready
+        self.ready = []
+        return chunks
+        
+    def flush(self):
+        """Returns the completed chunks followed by the partly filled one
+        """
+        chunks = self.pop()
+        if (self._count > 0):
+            chunks.append(self._storage[0:self._count]) # view, the storage goes with it
+            self._storage = self._allocate()
+            self._count = 0
+        return chunks
+        
+    def recycle(self, chunk):
+        """Returns the storage of a handed off chunk once it has been written
+        """
+        if chunk.base is not None:
+            chunk = chunk.base
+        if (chunk.shape[0] == self.rows) and (chunk.dtype == self.dtype) and (len(self._pool) < self._poolsize):
+            self._pool.append(chunk)
+    
+
+class UnicornBlackWriter():
+    """dedicated writer thread for one recording file
+    
+    chunks handed to put() wait in a bounded queue and are written by the writer thread, so
+    slow disks or fsync spikes never hold up the threads producing the data. How often the
+    file is forced to disk is set by the durability policy:
+    
+    interval    --  fsync at most every syncinterval seconds (default)
+    trial       --  fsync when sync() is called, UnicornBlackThreads does this when logging
+                    is allowed again at the end of a trial (safe_to_log(True))
+    chunk       --  fsync after every chunk
+    close       --  fsync only when the file is closed
+    """
+    
+    def __init__(self, fileobject, writefunction, durability='interval', syncinterval=5.0, maxqueue=64, name='datawriter', release=None):
+        self.fileobject = fileobject
+        self.writefunction = writefunction # called with each chunk to write it into fileobject
+        self.release = release # called with each chunk once it is written, so its storage can be reused
+        self.durability = durability
+        self.syncinterval = float(syncinterval)
+        self.cputime = 0.0 # CPU seconds used by the writer thread
+        self.byteswritten = 0
+        self.bytessynced = 0
+        self.bytesqueued = 0
+        self.syncs = 0
+        self.maxsynctime = 0.0
+        self._queue = queue.Queue(maxsize=int(maxqueue))
+        self._syncrequest = False
+        self._lastsync = time.perf_counter()
+        self._thread = Thread(target=self._write, args=[], daemon=True)
+        self._thread.name = name
+        self._thread.start()
+        
+    def put(self, chunk):
+        # hand a chunk to the writer, this only waits if maxqueue chunks are already waiting
+        self.bytesqueued = self.bytesqueued + chunk.nbytes
+        self._queue.put(chunk)
+        
+    def sync(self):
+        # ask the writer to force everything written so far to disk
+        self._syncrequest = True
+        
+    def close(self):
+        # write everything that is still queued, force it to disk, and close the file
+        self._queue.put(None) # poison pill approach
+        self._thread.join()
+        
+    def status(self):
+        """Returns queue depth and the bytes that are not yet safely on disk
+        """
+        return {'queuedepth': self._queue.qsize(), 'bytespending': int(self.bytesqueued + (self.byteswritten - self.bytessynced)), 'byteswritten': int(self.byteswritten), 'syncs': int(self.syncs), 'maxsynctime': float(self.maxsynctime), 'cputime': float(self.cputime)}
+        
+    def _fsync(self):
+        t = time.perf_counter()
+        self.fileobject.flush() # internal buffer to RAM
+        os.fsync(self.fileobject.fileno()) # RAM file cache to disk
+        self.maxsynctime = max(self.maxsynctime, time.perf_counter() - t)
+        self.bytessynced = self.byteswritten
+        self.syncs = self.syncs + 1
+        self._lastsync = time.perf_counter()
+        self._syncrequest = False
+        
+    def _write(self):
+        while True:
+            try:
+                chunk = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                chunk = False # nothing arrived, still check for a requested sync
+            
+            if chunk is None:
+                # Poison pill means shutdown
+                break
+            if chunk is not False:
+                self.writefunction(chunk)
+                self.fileobject.flush() # internal buffer to RAM
+                self.bytesqueued = self.bytesqueued - chunk.nbytes
+                if self.release is not None:
+                    self.release(chunk)
+                self.byteswritten = self.fileobject.tell()
+                if (self.durability == 'chunk'):
+                    self._fsync()
+            
+            if (self.byteswritten > self.bytessynced):
+                if (self.durability == 'interval') and ((time.perf_counter() - self._lastsync) >= self.syncinterval):
+                    self._fsync()
+                elif self._syncrequest:
+                    self._fsync()
+            self.cputime = time.thread_time()
+            
+        self._fsync()
+        self.fileobject.close()
+        self.cputime = time.thread_time()
+    
 
 class UnicornBlackThreads():    
     """class for data collection using the g.tec Unicorn Hybrid Black
@@ -285,7 +1043,7 @@ class UnicornBlackThreads():
     def __init__(self):
 
         # establish variables
-        self.collectversion = '2020.05.30.0'
+        self.collectversion = UnicornBlackCollectVersion
         self.device = None;
         self.path = os.path.dirname(os.getcwd())
         self.outputfolder = 'Raw'
@@ -293,15 +1051,14 @@ class UnicornBlackThreads():
         # create a Queue and Lock
         self._queue = Queue()
         self._queuelock = Lock()
-        self._logsamplequeue = Queue()
-        self._logeventqueue = Queue()
+        self._logsamplequeue = queue.Queue() # only shared between threads, so no pickling through a pipe
+        self._logeventqueue = queue.Queue()
         self._bufferlock = Lock()
-        self._loglock = Lock()
-        self._logeventlock = Lock()
         
         # initialize data collectors
         self.logdata = False
         self.logfilename = None
+        self.logformat = 'csv' # csv or binary
         self._timetemp = None
         self._safetolog = False
         self._dataheaderlog = False
@@ -316,16 +1073,49 @@ class UnicornBlackThreads():
         
         # activate
         self._receiveBuffer = None
+        self._receiveData = None
+        self._lastcounter = 0.0
+        self.droppedsamples = 0
+        self.duplicatesamples = 0
+        self.durability = 'interval' # interval, trial, chunk, or close (see UnicornBlackWriter)
+        self.syncinterval = 5.0 # seconds between fsync calls for the interval policy
+        self._datawriter = None
+        self._eventwriter = None
         self.lastsampledpoint = None
         self.data = None
+        
+        # markers are written into preallocated slots by mark_event and resolved by the streamer
+        # once the next frame arrives, so marking never formats strings or waits on a lock
+        self._markerslots = 4096
+        self._markers = numpy.zeros(self._markerslots, dtype=UnicornBlackEventType)
+        self._markerarrival = numpy.zeros(self._markerslots, dtype=numpy.int64) # arrival time of the sample each marker follows
+        self._markerready = numpy.zeros(self._markerslots, dtype=numpy.int64) # slot sequence + 1 once a marker is written
+        self._markerwrite = itertools.count() # next() is atomic, so several threads can mark at once
+        self._markerread = 0
+        self._latestsample = None # (sample counter, perf_counter_ns arrival) of the newest sample
+        self._historyslots = 256
+        self._samplehistory = [None] * self._historyslots # recent _latestsample pairs, so markers sent from another process can be placed by their own timestamp
+        self._historywrite = 0
+        self._outlet = None # network outlet started by publish()
+        self.quality = None # UnicornBlackCheckSignal started by start_quality
         self.printoutput = True
         self.ready = True
         
     
-    def connect(self, deviceID=None, rollingspan=3.0, logfilename='default'):
+    def connect(self, deviceID=None, rollingspan=3.0, logfilename='default', framelength=1, logformat='csv', sharedname=None):
+        # framelength is the number of samples requested from the device per GetData call
+        # logformat is either csv (human readable) or binary (float32 .bin with a .json header)
+        # sharedname attaches the rolling window to an existing shared memory block (see UnicornBlackProcess)
         
         self.deviceID = deviceID;
         self.logfilename = logfilename
+        self.logformat = logformat
+        self._frameLength = max(int(framelength), 1)
+        self._lastcounter = 0.0
+        self.droppedsamples = 0
+        self.duplicatesamples = 0
+        self._datawriter = None
+        self._eventwriter = None
         # make sure everything is disconnected
         try:
             self.device.StopAcquisition()
@@ -371,10 +1161,11 @@ class UnicornBlackThreads():
             self._numberOfAcquiredChannels = self.device.GetNumberOfAcquiredChannels()
             self._configuration = self.device.GetConfiguration()
         
-            # Allocate memory for the acquisition buffer.
+            # Allocate memory for the acquisition buffer once, the array is a view onto the same memory
             self._receiveBufferBufferLength = self._frameLength * self._numberOfAcquiredChannels * 4
             self._receiveBuffer = bytearray(self._receiveBufferBufferLength)
-            self.data = [[0.0] * self._numberOfAcquiredChannels] * math.floor( float(self._rollingspan) * float(self._samplefreq) )
+            self._receiveData = numpy.frombuffer(self._receiveBuffer, dtype=numpy.float32, count=self._numberOfAcquiredChannels * self._frameLength).reshape((self._frameLength, self._numberOfAcquiredChannels))
+            self.data = UnicornBlackRingBuffer(math.floor( float(self._rollingspan) * float(self._samplefreq) ), self._numberOfAcquiredChannels, sharedname=sharedname)
                     
             try:
                 # initialize sample streamer
@@ -388,6 +1179,7 @@ class UnicornBlackThreads():
             try:
                 # initialize data recorder
                 self._recording = True
+                self._sampleholding = UnicornBlackAccumulator(self._logchunksize, self._numberOfAcquiredChannels - 1, dtype=numpy.float32)
                 self._drthread = Thread(target=self._log_sample, args=[self._logsamplequeue], daemon=True)
                 self._drthread.name = 'datarecorder'
                 
@@ -431,6 +1223,8 @@ class UnicornBlackThreads():
         time.sleep((self._intsampletime * float(10)))
         
         #self.stoprecording()       
+        if self.quality is not None:
+            self.quality.stop()
         self._streaming = False
         try:
             self._ssthread.join()
@@ -449,6 +1243,15 @@ class UnicornBlackThreads():
         except:
             pass
         
+        try:
+            self.data.close() # detach from shared memory if it is being used
+        except:
+            pass
+        
+        if self._outlet is not None:
+            self._outlet.close()
+            self._outlet = None
+        
         del self.device
         self.device = None
         if self.printoutput:
@@ -467,48 +1270,94 @@ class UnicornBlackThreads():
         # keep streaming until it is signalled that we should stop
         while self._streaming:
             boolgetdata = False
-            self._bufferlock.acquire(True)
             try:
-                #sampledata = [numpy.ndarray.tolist(numpy.multiply(numpy.random.rand(int(self._numberOfAcquiredChannels)), 100))]
                 # Receives the configured number of samples from the Unicorn device and writes it to the acquisition buffer.
                 self.device.GetData(self._frameLength,self._receiveBuffer,self._receiveBufferBufferLength)
-                # Convert receive buffer to numpy float array 
-                sampledata = numpy.frombuffer(self._receiveBuffer, dtype=numpy.float32, count=self._numberOfAcquiredChannels * self._frameLength)
-                sampledata = numpy.reshape(sampledata, (self._frameLength, self._numberOfAcquiredChannels))
+                arrival = time.perf_counter_ns()
                 boolgetdata = True
             except:
-                self._receiveBufferBufferLength = self._frameLength * self._numberOfAcquiredChannels * 4
-                self._receiveBuffer = bytearray(self._receiveBufferBufferLength)
                 if self.printoutput:
                     print('\n\nOverflow error in polling device.\n\n') 
-            self._bufferlock.release()
-            
             
-            if boolgetdata:   
-                self._queuelock.acquire(True)
-                if not (str(int(float(self.data[-1][15]))) == str(int(float(sampledata[0][15])))): # protect against sampling the same point twice    
-                    #self.lastsampledpoint = copy.deepcopy(sampledata[0][15])
-                    self._logeventlock.acquire(True)
-                    self.lastsampledpoint = str(int(float(sampledata[0][15])))
-                    self._logeventlock.release()
+            if boolgetdata:
+                # check the sample counter for the whole frame at once
+                counters = self._receiveData[:,15]
+                priorcounters = numpy.maximum.accumulate(numpy.concatenate(([self._lastcounter], counters)))[0:-1]
+                keep = counters > priorcounters # protect against sampling the same point twice
+                newcounters = counters[keep]
+                if (len(newcounters) > 0):
+                    if (self._lastcounter > 0):
+                        gaps = numpy.diff(numpy.concatenate(([self._lastcounter], newcounters)))
+                    else:
+                        gaps = numpy.diff(newcounters)
+                    self.droppedsamples = self.droppedsamples + int(numpy.sum(gaps - 1))
+                    self._lastcounter = float(newcounters[-1])
+                    sampledata = self._receiveData[keep] # boolean indexing copies out of the receive buffer
+                    
+                    self._queuelock.acquire(True)
                     queue.put(sampledata)
-                    self.data.append(sampledata[0]) 
-                    self.data.pop(0)
-                self._queuelock.release()
-                
-                self._bufferlock.acquire(True)
-                self._receiveBuffer = bytearray(self._receiveBufferBufferLength) # make sure everything is cleared
-                self._bufferlock.release()
+                    self.data.push(sampledata) 
+                    self._queuelock.release()
+                    outlet = self._outlet
+                    if outlet is not None:
+                        outlet.push_samples(sampledata, arrival)
+                    
+                    self.lastsampledpoint = int(self._lastcounter)
+                    self._latestsample = (self.lastsampledpoint, arrival) # single assignment so readers see a matching pair
+                    self._samplehistory[self._historywrite % self._historyslots] = self._latestsample
+                    self._historywrite = self._historywrite + 1
+                    self._resolve_markers(self.lastsampledpoint, arrival)
+                self.duplicatesamples = self.duplicatesamples + int(len(counters) - len(newcounters))
         
             #time.sleep(float(0.000000000001)) 
             # if it is in, then we suddenly start getting blocking and drop samples
             # if we comment it out then we get all the samples, but run into an issue with screen flips
             
+        self._resolve_markers(None, None) # anything still pending keeps the latency it was marked at
         self._queuelock.acquire(True)
         queue.put(None) # poison pill approach
         self._queuelock.release()
-        self._eventrecording = False
+        self._logeventqueue.put(None) # the event recorder stops once it has logged everything before this
         
+    def _resolve_markers(self, counter, arrival):
+        """Moves pending markers to the event log, interpolating each marker time
+        between the arrival of the sample it followed and the arrival of the newest sample
+        
+        counter     --  newest sample counter (None to flush everything that is pending)
+        arrival     --  perf_counter_ns() arrival time of the newest sample
+        """
+        while (self._markerready[self._markerread % self._markerslots] == (self._markerread + 1)):
+            slot = self._markerread % self._markerslots
+            marker = self._markers[slot:slot + 1].copy()
+            if counter is not None:
+                if (marker['timestamp'][0] > arrival):
+                    break # marked after this frame arrived, resolve it against the next one
+                priorarrival = int(self._markerarrival[slot])
+                samples = counter - int(marker['latency'][0])
+                if (arrival > priorarrival) and (samples > 0):
+                    position = float(marker['timestamp'][0] - priorarrival) / float(arrival - priorarrival) * samples
+                    position = min(max(position, 0.0), float(samples))
+                    marker['latency'] = marker['latency'] + int(math.floor(position))
+                    marker['offset'] = position - math.floor(position)
+            self._logeventqueue.put(marker)
+            outlet = self._outlet
+            if outlet is not None:
+                outlet.push_markers(marker)
+            self._markerread = self._markerread + 1
+        
+
+    def _log_batch(self, logqueue, timeout=0.1):
+        # block until something arrives (or timeout seconds pass), then take everything that is waiting
+        try:
+            batch = [logqueue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                batch.append(logqueue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
 
     def _log_sample(self, logqueue):
         """Continuously log samples
@@ -517,44 +1366,30 @@ class UnicornBlackThreads():
 						from
 		"""
         
-        templogholding = None
+        templogholding = self._sampleholding
         finalpush = False
         # keep trying to log until it is signalled that we should stop
         while self._recording:   
-            # read new item from the queue 
-            while not logqueue.empty():
-                self._loglock.acquire(True)
-                sampledata = logqueue.get()
-                self._loglock.release()
-                
+            # read everything that is waiting in the queue, sleeping while it is empty
+            for sampledata in self._log_batch(logqueue):
                 if sampledata is None:
                     # Poison pill means shutdown
                     self._recording = False
                     finalpush = True
                     break
-                    break
-                else:
-                    if self.logdata:
-                        if templogholding is None:
-                            templogholding = sampledata[:,0:-1]
-                        else:
-                            templogholding = numpy.vstack([templogholding, sampledata[:,0:-1]])
-                            
-                        # check if it is safe to log
-                        if self._safetolog:
-                            # only write chunks of data to save I/O overhead
-                            if (len(templogholding) >= self._logchunksize):
-                                numpy.savetxt(self._logfile,templogholding,delimiter=',',fmt='%.3f',newline='\n')
-                                self._logfile.flush() # internal buffer to RAM
-                                os.fsync(self._logfile.fileno()) # RAM file cache to disk
-                                templogholding = None            
+                if self.logdata:
+                    templogholding.append(sampledata[:,0:-1])
+                    
+            # check if it is safe to log
+            if self._safetolog and (self._datawriter is not None):
+                # only write complete chunks of data to save I/O overhead
+                for chunk in templogholding.pop():
+                    self._datawriter.put(chunk)
         if finalpush:
-            if templogholding is not None:
-                numpy.savetxt(self._logfile,templogholding,delimiter=',',fmt='%.3f',newline='\n')
-                self._logfile.flush() # internal buffer to RAM
-                os.fsync(self._logfile.fileno()) # RAM file cache to disk
-                templogholding = None
-                self._logfile.close()
+            if self._datawriter is not None:
+                for chunk in templogholding.flush():
+                    self._datawriter.put(chunk)
+                self._datawriter.close()
 
     def _log_event(self, logeventqueue):
         """Continuously log events
@@ -562,70 +1397,76 @@ class UnicornBlackThreads():
 		logeventqueue	--	a multithreading.Queue instance, to read samples
 						from
 		"""
-        eventheaderlog = False
-        templogholding = None
+        templogholding = UnicornBlackAccumulator(self._logchunksize, dtype=UnicornBlackEventType)
         # keep trying to log until it is signalled that we should stop
         while self._eventrecording:   
-            # read new item from the queue 
-            while not logeventqueue.empty():
-                self._logeventlock.acquire(True)
-                sampledata = logeventqueue.get()
-                self._logeventlock.release()
-            
-                # wait to create file until we know there is a need
-                if self.logdata:
-                    if not eventheaderlog:
-                        header = 'collect.....= UnicornPy_' + self.collectversion + '\n'
-                        header = header + 'date........= ' + self._timetemp  + '\n'
-                        header = header + 'filename....= ' + self.logfilename  + '\n'
-                        header = header + 'Latency, Event' + '\n'
-                        self._eventlogfile = open('%s.csve' % (self.logfilename), 'w')
-                        self._eventlogfile.write(header) # to internal buffer
-                        self._eventlogfile.flush() # internal buffer to RAM
-                        os.fsync(self._eventlogfile.fileno()) # RAM file cache to disk  
-                        eventheaderlog = True 
-                    
+            # read everything that is waiting in the queue, sleeping while it is empty
+            for sampledata in self._log_batch(logeventqueue):
                 if sampledata is None:
                     # Poison pill means shutdown
                     self._eventrecording = False
                     break
-                    break
-                else:
-                    if self.logdata:
-                        if templogholding is None:
-                            templogholding = sampledata
+                    
+                # wait to create file until we know there is a need
+                if self.logdata:
+                    if self._eventwriter is None:
+                        if (self.logformat == 'binary'):
+                            # event layout is described by the .json header
+                            self._eventlogfile = open('%s.bine' % (self.logfilename), 'wb')
                         else:
-                            templogholding = numpy.vstack([templogholding, sampledata])
-                            
-                        # check if it is safe to log
-                        if self._safetolog:
-                            # only write chunks of data to save I/O overhead
-                            if (len(templogholding) >= self._logchunksize):
-                                numpy.savetxt(self._eventlogfile,templogholding,delimiter=',',fmt='%.3f',newline='\n')
-                                self._eventlogfile.flush() # internal buffer to RAM
-                                os.fsync(self._eventlogfile.fileno()) # RAM file cache to disk
-                                templogholding = None            
-        
-        if templogholding is not None:
-                numpy.savetxt(self._eventlogfile,templogholding,delimiter=',',fmt='%s',newline='\n')
-                self._eventlogfile.flush() # internal buffer to RAM
-                os.fsync(self._eventlogfile.fileno()) # RAM file cache to disk
-                templogholding = None
-                self._eventlogfile.close()
+                            header = 'collect.....= UnicornPy_' + self.collectversion + '\n'
+                            header = header + 'date........= ' + self._timetemp  + '\n'
+                            header = header + 'filename....= ' + self.logfilename  + '\n'
+                            header = header + 'Latency, Event, Offset, Timestamp' + '\n'
+                            self._eventlogfile = open('%s.csve' % (self.logfilename), 'w')
+                            self._eventlogfile.write(header) # to internal buffer
+                        self._eventwriter = UnicornBlackWriter(self._eventlogfile, self._write_events, durability=self.durability, syncinterval=self.syncinterval, name='eventwriter', release=templogholding.recycle)
+                        self._eventwriter.sync()
+                    templogholding.append(sampledata)
+                    
+            # check if it is safe to log
+            if self._safetolog and (self._eventwriter is not None):
+                # only write complete chunks of data to save I/O overhead
+                for chunk in templogholding.pop():
+                    self._eventwriter.put(chunk)
         
+        if self._eventwriter is not None:
+            for chunk in templogholding.flush():
+                self._eventwriter.put(chunk)
+            self._eventwriter.close()
+        
+        
+    def _write_samples(self, sampledata):
+        # write a chunk of samples in the selected format
+        if (self.logformat == 'binary'):
+            numpy.ascontiguousarray(sampledata, dtype='<f4').tofile(self._logfile)
+        else:
+            numpy.savetxt(self._logfile,sampledata,delimiter=',',fmt='%.3f',newline='\n')
+    
+    def _write_events(self, eventdata):
+        # write a chunk of events in the selected format
+        if (self.logformat == 'binary'):
+            eventdata.tofile(self._eventlogfile)
+        else:
+            for incrX in range(len(eventdata)):
+                self._eventlogfile.write('%d,%d,%.3f,%d\n' % (eventdata['latency'][incrX], eventdata['event'][incrX], eventdata['offset'][incrX], eventdata['timestamp'][incrX]))
         
     def startrecording(self):
         
         self.logdata = True
         timetemp = str(datetime.now()).split()
         self._timetemp = timetemp[0] + 'T' + timetemp[1]
-        self._logfile = open('%s.csv' % (self.logfilename), 'w')
+        if (self.logformat == 'binary'):
+            self._logfile = open('%s.bin' % (self.logfilename), 'wb')
+        else:
+            self._logfile = open('%s.csv' % (self.logfilename), 'w')
         self._safetolog = True
         self._log_header()
+        self._datawriter = UnicornBlackWriter(self._logfile, self._write_samples, durability=self.durability, syncinterval=self.syncinterval, name='datawriter', release=self._sampleholding.recycle)
         
         # ensure we are getting data
         nc = 0
-        while (str(int(float(self.data[-1][15]))) == str(int(float(0.0)))):
+        while (str(int(float(self.data.latest()[15]))) == str(int(float(0.0)))):
             nc = nc + 1
         
         if self.printoutput:
@@ -636,6 +1477,11 @@ class UnicornBlackThreads():
         """Logs a header to the data file
         """
         if not self._dataheaderlog: 
+            if (self.logformat == 'binary'):
+                self._log_binaryheader()
+                self._dataheaderlog = True
+                return
+            
             header = 'collect.....= UnicornPy_' + self.collectversion + '\n'
             header = header + 'device......= ' + self.deviceID  + '\n'
             header = header + ('samplerate..= %.3f' % self._samplefreq)  + '\n'
@@ -649,23 +1495,88 @@ class UnicornBlackThreads():
             self._logfile.flush() # internal buffer to RAM
             os.fsync(self._logfile.fileno()) # RAM file cache to disk
             self._dataheaderlog = True 
+    
+    def _log_binaryheader(self):
+        """Logs the .json header that describes a binary recording
+        """
+        header = {'collect': 'UnicornPy_' + self.collectversion,
+                  'device': self.deviceID,
+                  'samplerate': float(self._samplefreq),
+                  'channels': int(self._numberOfAcquiredChannels - 1),
+                  'date': self._timetemp,
+                  'filename': self.logfilename,
+                  'channellabels': [x.strip() for x in self.channellabels.split(',')],
+                  'dtype': '<f4',
+                  'datafile': os.path.basename(self.logfilename) + '.bin',
+                  'eventfile': os.path.basename(self.logfilename) + '.bine',
+                  'eventdtype': UnicornBlackEventType.descr}
+        headerfile = open('%s.json' % (self.logfilename), 'w')
+        json.dump(header, headerfile, indent=4)
+        headerfile.flush() # internal buffer to RAM
+        os.fsync(headerfile.fileno()) # RAM file cache to disk
+        headerfile.close()
        
             
-    def mark_event(self, event):
+    def publish(self, port=16500, host='127.0.0.1', protocol='tcp'):
+        """Publishes the samples and markers over a network socket (see unicornhybridblackstream)
+        
+        port        --  port the outlet listens on for subscribers (0 picks a free port)
+        host        --  interface to listen on, '0.0.0.0' to accept other machines
+        protocol    --  tcp or udp
+        """
+        info = {'device': self.deviceID, 'samplerate': float(self._samplefreq), 'channels': int(self._numberOfAcquiredChannels), 'channellabels': [x.strip() for x in self.channellabels.split(',')]}
+        self._outlet = unicornhybridblackstream.UnicornBlackOutlet(port=port, host=host, protocol=protocol, info=info)
+        if self.printoutput:
+            print("Publishing '%s' over %s port %d." % (self.deviceID, protocol, self._outlet.port))
+        return self._outlet.port
+        
+    def mark_event(self, event, timestamp=None):
         """Logs data to the event file
+        
+        timestamp   --  time.perf_counter_ns() of the event, taken now if not provided
         """
-        if self.lastsampledpoint is not None:
-            self._logeventlock.acquire(True)
-            self._logeventqueue.put(numpy.array([str(self.lastsampledpoint), str(event)]))
-            self._logeventlock.release()
+        if timestamp is None:
+            timestamp = time.perf_counter_ns()
+        event = UnicornBlackEventCode(event)
+        latestsample = self._latestsample
+        if (latestsample is not None) and (timestamp < latestsample[1]):
+            latestsample = self._sample_at(timestamp, latestsample) # marked before the newest sample arrived
+        if latestsample is not None:
+            sequence = next(self._markerwrite)
+            slot = sequence % self._markerslots
+            self._markers[slot] = (latestsample[0], event, 0.0, timestamp)
+            self._markerarrival[slot] = latestsample[1]
+            self._markerready[slot] = sequence + 1 # publish the slot last
+        
+    def _sample_at(self, timestamp, latestsample):
+        # walks back through the recent samples to the newest one that had arrived by timestamp
+        # falls back to the oldest sample still remembered if timestamp is older than all of them
+        newest = self._historywrite
+        for index in range(newest - 1, max(newest - self._historyslots, 0) - 1, -1):
+            sample = self._samplehistory[index % self._historyslots]
+            if (sample is None) or (sample[1] > latestsample[1]):
+                break # the streamer has wrapped around onto this slot
+            latestsample = sample
+            if (sample[1] <= timestamp):
+                break
+        return latestsample
         
     def safe_to_log(self, boolsafe=True):
         """Parameter to change logging settings
         """
+        if boolsafe and not self._safetolog:
+            # end of a trial, a good moment to force the files to disk
+            for writer in [self._datawriter, self._eventwriter]:
+                if writer is not None:
+                    writer.sync()
         self._safetolog = boolsafe  
         
-    def sample_data(self):
-        datasample = self.data[:]
+    def sample_data(self, out=None):
+        # time ordered (samples x channels) float32 array of the rolling window
+        # out is an optional preallocated array of the same shape that is filled in place
+        self._queuelock.acquire(True)
+        datasample = self.data.snapshot(out=out)
+        self._queuelock.release()
         return datasample
             
     def check_battery(self):
@@ -680,6 +1591,107 @@ class UnicornBlackThreads():
             print('Device battery at %d percent.' % powerlevel)
         return powerlevel
     
+    def check_samples(self):
+        """Returns the sample counter accounting since connect
+        """
+        samplecheck = {'samples': int(self.data.count), 'dropped': int(self.droppedsamples), 'duplicate': int(self.duplicatesamples)}
+        if self.printoutput:
+            print('Device streamed %d samples, %d dropped, %d duplicated.' % (samplecheck['samples'], samplecheck['dropped'], samplecheck['duplicate']))
+        return samplecheck
+    
+    @property
+    def logcputime(self):
+        # CPU seconds used by the data writer thread
+        if self._datawriter is None:
+            return 0.0
+        return self._datawriter.cputime
+    
+    @property
+    def logbytes(self):
+        # bytes written to the data file
+        if self._datawriter is None:
+            return 0
+        return self._datawriter.byteswritten
+    
+    def _logging_status(self):
+        logcheck = {'cputime': float(self.logcputime), 'bytes': int(self.logbytes), 'queuedepth': 0, 'bytespending': 0}
+        if self._datawriter is not None:
+            writerstatus = self._datawriter.status()
+            logcheck['queuedepth'] = writerstatus['queuedepth']
+            logcheck['bytespending'] = writerstatus['bytespending']
+        return logcheck
+    
+    def check_logging(self):
+        """Returns the CPU time used by the data writer thread, the bytes it has written,
+        and how much is still waiting to reach the disk
+        """
+        logcheck = self._logging_status()
+        if self.printoutput:
+            print('Data writer used %0.3f seconds of CPU time to write %d bytes.' % (logcheck['cputime'], logcheck['bytes']))
+        return logcheck
+    
+    def check_clock(self):
+        """Returns the sample counter of the newest sample and its perf_counter_ns() arrival time
+        """
+        latestsample = self._latestsample
+        if latestsample is None:
+            return {'counter': 0, 'arrival': 0}
+        return {'counter': int(latestsample[0]), 'arrival': int(latestsample[1])}
+
+    def start_quality(self, interval=1.0, length=3600, highpassfilter=1.0, lowpassfilter=26.0):
+        """Checks the signal quality of the EEG channels every interval seconds in the background,
+        see UnicornBlackCheckSignal.track_quality
+        """
+        self.quality = UnicornBlackCheckSignal()
+        self.quality.highpassfilter = highpassfilter
+        self.quality.lowpassfilter = lowpassfilter
+        return self.quality.track_quality(self, [label.strip() for label in self.channellabels.split(',')][0:8], interval=interval, length=length)
+    
+    def check_quality(self):
+        if self.quality is None:
+            return {'checks': 0, 'degraded': {}}
+        return self.quality.check_quality(printoutput=self.printoutput)
+    
+def UnicornBinaryToCSV(filename):
+    """Converts a binary recording (.json, .bin, .bine) into the .csv and .csve layout
+    
+    filename    --  recording name without extension
+    """
+    headerfile = open('%s.json' % (filename), 'r')
+    header = json.load(headerfile)
+    headerfile.close()
+    folder = os.path.dirname(filename)
+    
+    data = numpy.fromfile(os.path.join(folder, header['datafile']), dtype=header['dtype']).reshape((-1, header['channels']))
+    csvheader = 'collect.....= ' + header['collect'] + '\n'
+    csvheader = csvheader + 'device......= ' + header['device'] + '\n'
+    csvheader = csvheader + ('samplerate..= %.3f' % header['samplerate']) + '\n'
+    csvheader = csvheader + ('channels....= %d' % header['channels']) + '\n'
+    csvheader = csvheader + 'date........= ' + header['date'] + '\n'
+    csvheader = csvheader + 'filename....= ' + header['filename'] + '\n'
+    csvheader = csvheader + ', '.join(header['channellabels']) + '\n'
+    logfile = open('%s.csv' % (filename), 'w')
+    logfile.write(csvheader)
+    numpy.savetxt(logfile,data,delimiter=',',fmt='%.3f',newline='\n')
+    logfile.close()
+    
+    eventfilename = os.path.join(folder, header['eventfile'])
+    if os.path.isfile(eventfilename):
+        events = numpy.fromfile(eventfilename, dtype=numpy.dtype([tuple(x) for x in header['eventdtype']]))
+        csvheader = 'collect.....= ' + header['collect'] + '\n'
+        csvheader = csvheader + 'date........= ' + header['date'] + '\n'
+        csvheader = csvheader + 'filename....= ' + header['filename'] + '\n'
+        eventlogfile = open('%s.csve' % (filename), 'w')
+        if 'offset' in events.dtype.names:
+            eventlogfile.write(csvheader + 'Latency, Event, Offset, Timestamp' + '\n')
+            for incrX in range(len(events)):
+                eventlogfile.write('%d,%d,%.3f,%d\n' % (events['latency'][incrX], events['event'][incrX], events['offset'][incrX], events['timestamp'][incrX]))
+        else:
+            eventlogfile.write(csvheader + 'Latency, Event' + '\n')
+            for incrX in range(len(events)):
+                eventlogfile.write('%d,%d\n' % (events['latency'][incrX], events['event'][incrX]))
+        eventlogfile.close()
+    
 # # # # #
 # DEBUG #
 if __name__ == "__main__":
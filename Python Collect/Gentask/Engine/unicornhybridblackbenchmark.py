@@ -0,0 +1,147 @@
+# unicornhybridblackbenchmark: throughput and latency benchmarks for the unicornhybridblack
+#
+"""
+UnicornBlackBenchmark drives UnicornBlackThreads or UnicornBlackProcess for a set
+duration while pulling data and marking events the way a task would, then reports
+
+    samples per second, dropped and duplicate samples (from the counter channel),
+    sample_data() and mark_event() latency percentiles (milliseconds),
+    data writer CPU time, and bytes written
+
+Results are returned as a dictionary and can be saved as JSON so regressions can be
+tracked across releases.
+
+Unless UNICORN_SIMULATOR is already set, the simulated device (unicornpysimulator) is
+used so the benchmark runs on machines without the hardware.
+
+Working notes
+- run from an external terminal, multiprocessing does not play nicely with Spyder
+
+@author: Matt Pontifex
+"""
+
+import os
+import sys
+import time
+import json
+import platform
+import numpy
+
+os.environ.setdefault('UNICORN_SIMULATOR', '1')
+try:
+    import unicornhybridblack as unicornhybridblack
+except:
+    import Engine.unicornhybridblack as unicornhybridblack
+
+
+class UnicornBlackBenchmark():
+
+    def __init__(self):
+        self.mode = 'Thread' # Thread or Process
+        self.duration = 60.0 # seconds of acquisition
+        self.deviceID = 'UN-0000.00.00'
+        self.rollingspan = 13.5
+        self.framelength = 1
+        self.logformat = 'csv'
+        self.logfilename = 'benchmark'
+        self.pullinterval = 0.2 # seconds between sample_data() calls, like the viewer
+        self.markinterval = 0.5 # seconds between mark_event() calls
+        self.percentiles = [50, 90, 99, 100]
+        self.printoutput = False
+        self.results = None
+
+    def _percentiles(self, values):
+        # latency summary in milliseconds
+        summary = {}
+        if (len(values) > 0):
+            values = numpy.array(values) * 1000.0
+            for percentile in self.percentiles:
+                summary['p%d' % percentile] = float(numpy.percentile(values, percentile))
+        return summary
+
+    def run(self):
+        """Runs one benchmark and returns the results dictionary
+        """
+        if (self.mode == 'Process'):
+            UnicornBlack = unicornhybridblack.UnicornBlackProcess()
+        else:
+            UnicornBlack = unicornhybridblack.UnicornBlackThreads()
+        UnicornBlack.printoutput = self.printoutput
+        UnicornBlack.connect(deviceID=self.deviceID, rollingspan=self.rollingspan, logfilename=self.logfilename, framelength=self.framelength, logformat=self.logformat)
+        UnicornBlack.startrecording()
+        startcount = UnicornBlack.check_samples()['samples']
+
+        pulltimes = []
+        marktimes = []
+        event = 0
+        starttime = time.perf_counter()
+        nextpull = starttime
+        nextmark = starttime + self.markinterval
+        while ((time.perf_counter() - starttime) < self.duration):
+            now = time.perf_counter()
+            if (now >= nextpull):
+                t = time.perf_counter()
+                UnicornBlack.sample_data()
+                pulltimes.append(time.perf_counter() - t)
+                nextpull = nextpull + self.pullinterval
+            if (now >= nextmark):
+                event = (event % 250) + 1
+                t = time.perf_counter()
+                UnicornBlack.mark_event(event)
+                marktimes.append(time.perf_counter() - t)
+                nextmark = nextmark + self.markinterval
+            time.sleep(max(min(nextpull, nextmark) - time.perf_counter(), 0.0))
+        elapsed = time.perf_counter() - starttime
+
+        samplecheck = UnicornBlack.check_samples()
+        UnicornBlack.disconnect()
+        samplecheck = UnicornBlack.check_samples() # final counts once everything has stopped
+        logcheck = UnicornBlack.check_logging()
+
+        bytesondisk = 0
+        for extension in ['.csv', '.csve', '.bin', '.bine', '.json']:
+            if os.path.isfile(self.logfilename + extension):
+                bytesondisk = bytesondisk + os.path.getsize(self.logfilename + extension)
+
+        self.results = {'mode': self.mode,
+                        'framelength': self.framelength,
+                        'logformat': self.logformat,
+                        'duration': elapsed,
+                        'samples': samplecheck['samples'] - startcount,
+                        'samplespersecond': (samplecheck['samples'] - startcount) / elapsed,
+                        'dropped': samplecheck['dropped'],
+                        'duplicate': samplecheck['duplicate'],
+                        'sampledatalatency': self._percentiles(pulltimes),
+                        'markeventlatency': self._percentiles(marktimes),
+                        'writercputime': logcheck['cputime'],
+                        'byteswritten': logcheck['bytes'],
+                        'bytesondisk': bytesondisk,
+                        'collectversion': unicornhybridblack.UnicornBlackCollectVersion,
+                        'python': platform.python_version(),
+                        'platform': platform.platform(),
+                        'simulator': os.environ.get('UNICORN_SIMULATOR', '') not in ['', '0']}
+        return self.results
+
+    def save(self, filename):
+        """Appends the results as one JSON line so a file can hold the history across releases
+        """
+        outputfile = open(filename, 'a')
+        outputfile.write(json.dumps(self.results) + '\n')
+        outputfile.close()
+
+
+# # # # #
+# DEBUG #
+if __name__ == "__main__":
+
+    duration = 60.0 # seconds
+    if (len(sys.argv) > 1):
+        duration = float(sys.argv[1])
+
+    for mode in ['Thread', 'Process']:
+        benchmark = UnicornBlackBenchmark()
+        benchmark.mode = mode
+        benchmark.duration = duration
+        benchmark.logfilename = 'benchmark_%s' % mode.lower()
+        print(json.dumps(benchmark.run(), indent=4))
+        benchmark.save('benchmark.jsonl')
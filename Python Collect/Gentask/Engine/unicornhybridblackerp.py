@@ -0,0 +1,270 @@
+# unicornhybridblackerp: class to average event related potentials while the data is being collected
+#
+"""
+UnicornBlackERP cuts epochs around event markers as soon as the data after each marker has
+arrived, and keeps a running average for every event type
+
+    the samples and markers come from a UnicornBlackInlet (see unicornhybridblackstream),
+    or from any object with sample_data() and events() methods
+    each epoch is filtered, baseline corrected, and rejected if any channel exceeds the
+    voltage threshold, matching the eegpipe chain used after the session
+    means and variances are updated with Welford's method, so no epochs are stored
+    check_stability() reports the standard error of the average so a session can be
+    stopped once the waveform has settled
+
+Working notes
+- the rolling window of the source has to hold the filter padding on both sides of the epoch
+- does not depend on UnicornPy, so it can run on the experimenter machine or elsewhere
+
+@author: Matt Pontifex
+"""
+
+import math
+import time
+import numpy
+import scipy.signal
+from threading import Thread, Lock
+
+
+class UnicornBlackERP():
+    """online event related potential averaging
+    """
+
+    def __init__(self, source=None, eventtypes=None):
+        self.source = source # object with sample_data() and events() methods
+        self.eventtypes = eventtypes # event codes to average, all events if None
+        self.samplefreq = 250.0
+        self.channels = [0, 1, 2, 3, 4, 5, 6, 7] # EEG columns of the sample data
+        self.counterchannel = 15 # column holding the sample counter
+        self.window = [-200.0, 600.0] # epoch in milliseconds around the event
+        self.baselinewindow = [-100.0, 0.0] # milliseconds, None to skip baseline correction
+        self.threshold = [-100.0, 100.0] # microvolts, None to skip artifact rejection
+        self.highpassfilter = 1.0 # Hz, None to skip
+        self.lowpassfilter = 25.0 # Hz, None to skip
+        self.filterorder = 3
+        self.filterpadding = 500.0 # milliseconds of data filtered on each side of the epoch
+        self.printoutput = False
+        self._lock = Lock() # guards the averages and pending events shared with the update thread
+        self._updating = False
+        self.reset()
+
+    def reset(self):
+        """Forgets all averages and pending events
+        """
+        self._lock.acquire(True)
+        self.counts = {} # accepted epochs per event type
+        self.rejected = {} # rejected epochs per event type
+        self.missed = 0 # events whose data had already left the rolling window
+        self._mean = {}
+        self._m2 = {}
+        self._pending = []
+        self._eventsread = 0
+        self._sos = None
+        self._lock.release()
+
+    def times(self):
+        """Returns the time of each epoch sample in milliseconds
+        """
+        start, stop = self._epochsamples()
+        return numpy.arange(start, stop) * 1000.0 / self.samplefreq
+
+    def _epochsamples(self):
+        start = int(math.floor(self.window[0] * self.samplefreq / 1000.0))
+        stop = int(math.ceil(self.window[1] * self.samplefreq / 1000.0)) + 1
+        return start, stop
+
+    def _filter(self, segment):
+        # zero phase filtering of the padded segment, same design as the post session chain
+        if self._sos is None:
+            if (self.highpassfilter is not None) and (self.lowpassfilter is not None):
+                self._sos = scipy.signal.butter(self.filterorder, [self.highpassfilter, self.lowpassfilter], btype='bandpass', output='sos', fs=self.samplefreq)
+            elif self.highpassfilter is not None:
+                self._sos = scipy.signal.butter(self.filterorder, self.highpassfilter, btype='highpass', output='sos', fs=self.samplefreq)
+            elif self.lowpassfilter is not None:
+                self._sos = scipy.signal.butter(self.filterorder, self.lowpassfilter, btype='lowpass', output='sos', fs=self.samplefreq)
+            else:
+                return segment
+        return scipy.signal.sosfiltfilt(self._sos, segment, axis=0)
+
+    def add_event(self, latency, event, offset=0.0):
+        """Queues an event to be averaged once the data after it has arrived
+
+        latency     --  sample counter of the event
+        event       --  event code
+        offset      --  fraction of a sample past latency
+        """
+        if (self.eventtypes is None) or (int(event) in self.eventtypes):
+            self._lock.acquire(True)
+            self._pending.append((int(latency), int(event), float(offset)))
+            self._lock.release()
+
+    def update(self, sampledata=None):
+        """Reads new events from the source and averages every epoch that is complete
+
+        sampledata  --  (samples x channels) rolling window, pulled from the source if None
+        returns the number of epochs added
+        """
+        if self.source is not None:
+            if hasattr(self.source, 'events'):
+                events = self.source.events()
+                for marker in events[self._eventsread:]:
+                    self.add_event(marker['latency'], marker['event'], marker['offset'])
+                self._eventsread = len(events)
+            if sampledata is None:
+                sampledata = self.source.sample_data()
+        if (sampledata is None) or (len(sampledata) == 0) or (len(self._pending) == 0):
+            return 0
+
+        counters = sampledata[:,self.counterchannel]
+        valid = numpy.flatnonzero(counters > 0) # rows not filled yet hold zeros
+        if (len(valid) == 0):
+            return 0
+        first = valid[0]
+        start, stop = self._epochsamples()
+        padding = int(math.ceil(self.filterpadding * self.samplefreq / 1000.0))
+        baseline = None
+        if self.baselinewindow is not None:
+            baseline = [int(round(x * self.samplefreq / 1000.0)) - start for x in self.baselinewindow]
+
+        added = 0
+        missed = 0
+        self._lock.acquire(True)
+        pending = self._pending
+        self._pending = []
+        self._lock.release()
+        waiting = []
+        for latency, event, offset in pending:
+            row = first + int(numpy.searchsorted(counters[first:], latency))
+            if (row >= len(counters)) or ((row + stop + padding) > len(counters)):
+                waiting.append((latency, event, offset)) # the rest of the epoch has not arrived yet
+                continue
+            if ((row + start - padding) < first):
+                missed = missed + 1 # already left the rolling window
+                continue
+            if (offset >= 0.5):
+                row = row + 1 # nearest sample to the marker
+                if ((row + stop + padding) > len(counters)):
+                    waiting.append((latency, event, offset))
+                    continue
+
+            segment = numpy.array(sampledata[(row + start - padding):(row + stop + padding), self.channels], dtype=numpy.float64)
+            epoch = self._filter(segment)[padding:(padding + stop - start),:]
+            if baseline is not None:
+                epoch = epoch - numpy.mean(epoch[max(baseline[0], 0):max(baseline[1], 1),:], axis=0)
+            self._accumulate(event, epoch)
+            added = added + 1
+
+        self._lock.acquire(True)
+        self.missed = self.missed + missed
+        self._pending = waiting + self._pending
+        self._lock.release()
+        return added
+
+    def _accumulate(self, event, epoch):
+        # artifact rejection, then Welford's running mean and variance
+        if self.threshold is not None:
+            if (numpy.min(epoch) < self.threshold[0]) or (numpy.max(epoch) > self.threshold[1]):
+                self._lock.acquire(True)
+                self.rejected[event] = self.rejected.get(event, 0) + 1
+                self._lock.release()
+                if self.printoutput:
+                    print('Event %d epoch rejected.' % event)
+                return
+        self._lock.acquire(True)
+        if event not in self.counts:
+            self.counts[event] = 0
+            self._mean[event] = numpy.zeros(epoch.shape)
+            self._m2[event] = numpy.zeros(epoch.shape)
+        self.counts[event] = self.counts[event] + 1
+        delta = epoch - self._mean[event]
+        self._mean[event] = self._mean[event] + (delta / self.counts[event])
+        self._m2[event] = self._m2[event] + (delta * (epoch - self._mean[event]))
+        self._lock.release()
+
+    def average(self, event):
+        """Returns the (samples x channels) running average for an event type
+        """
+        self._lock.acquire(True)
+        average = None
+        if event in self.counts:
+            average = self._mean[event].copy()
+        self._lock.release()
+        return average
+
+    def variance(self, event):
+        """Returns the (samples x channels) sample variance across the accepted epochs
+        """
+        self._lock.acquire(True)
+        variance = self._variance(event)
+        self._lock.release()
+        return variance
+
+    def _variance(self, event):
+        # caller holds the lock
+        if (self.counts.get(event, 0) < 2):
+            return None
+        return self._m2[event] / (self.counts[event] - 1)
+
+    def check_stability(self, event=None):
+        """Returns the mean standard error of the average (microvolts) for each event type
+
+        the standard error shrinks as epochs are added, so a session can be stopped once it
+        falls below a chosen criterion
+        """
+        stability = {}
+        self._lock.acquire(True)
+        counts = dict(self.counts)
+        rejected = dict(self.rejected)
+        for eventtype in counts:
+            if (event is not None) and (eventtype != event):
+                continue
+            variance = self._variance(eventtype)
+            if variance is None:
+                stability[eventtype] = float('inf')
+            else:
+                stability[eventtype] = float(numpy.mean(numpy.sqrt(variance / counts[eventtype])))
+        self._lock.release()
+        if self.printoutput:
+            for eventtype in stability:
+                print('Event %d: %d epochs (%d rejected), standard error %0.2f microvolts.' % (eventtype, counts[eventtype], rejected.get(eventtype, 0), stability[eventtype]))
+        return stability
+
+    def start(self, interval=0.1):
+        """Updates the averages every interval seconds from a background thread
+        """
+        self._updating = True
+        self._uthread = Thread(target=self._update, args=[interval], daemon=True)
+        self._uthread.name = 'erpaverager'
+        self._uthread.start()
+
+    def stop(self):
+        self._updating = False
+        self._uthread.join()
+
+    def _update(self, interval):
+        while self._updating:
+            self.update()
+            time.sleep(interval)
+
+
+# # # # #
+# DEBUG #
+if __name__ == "__main__":
+
+    # synthetic check: a 5 microvolt positive peak 100 ms after each event, buried in noise
+    samplefreq = 250.0
+    random = numpy.random.default_rng(0)
+    sampledata = numpy.zeros((int(samplefreq * 200), 17), dtype=numpy.float32)
+    sampledata[:,0:8] = random.normal(0.0, 10.0, (sampledata.shape[0], 8))
+    sampledata[:,15] = numpy.arange(1, sampledata.shape[0] + 1)
+    peak = 5.0 * numpy.exp(-0.5 * ((numpy.arange(-50, 150) / samplefreq - 0.1) / 0.02) ** 2)
+
+    erp = UnicornBlackERP(eventtypes=[8])
+    for latency in range(500, sampledata.shape[0] - 500, 250):
+        sampledata[latency - 50:latency + 150, 0:8] += peak[:,numpy.newaxis].astype(numpy.float32)
+        erp.add_event(latency, 8)
+    erp.update(sampledata)
+    erp.printoutput = True
+    erp.check_stability()
+    times = erp.times()
+    print('Peak at %0.0f ms.' % times[numpy.argmax(numpy.mean(erp.average(8), axis=1))])
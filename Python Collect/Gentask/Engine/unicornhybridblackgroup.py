@@ -0,0 +1,259 @@
+# unicornhybridblackgroup: class to run several g.tec Unicorn Hybrid Black devices together
+#
+"""
+UnicornBlackGroup runs one UnicornBlackProcess per device from a single script, for
+group and hyperscanning sessions
+
+    one mark_event() call stamps every device with the same perf_counter_ns() time
+    sample_data() returns the rolling windows of all devices aligned in time
+    each device writes its own recording, tied together by a session header (.json)
+
+Every device has its own acquisition process (and its own shared memory window), so the
+number of devices is limited by the cores available rather than by the Python interpreter.
+
+The devices start counting samples when they are connected, so their sample counters do
+not line up. The clock offset of each device is estimated from the arrival time of its
+newest sample: arrival - (counter / samplefreq) is the host time at which the counter was
+zero. Transfer delays only ever make a sample late, so the smallest estimate over the last
+clockwindow readings is used. Because a single early reading would otherwise be kept for
+the whole window, readings more than one frame away from the running median are rejected.
+The clocks are read every clockinterval seconds from a background thread from connect()
+on, so the estimate does not depend on how often the task calls sample_data().
+
+Working notes
+- run from an external terminal, multiprocessing does not play nicely with Spyder
+
+@author: Matt Pontifex
+"""
+
+import os
+import json
+import time
+import collections
+import numpy
+from datetime import datetime
+from threading import Thread, Lock, Event
+
+try:
+    import unicornhybridblack as unicornhybridblack
+except:
+    import Engine.unicornhybridblack as unicornhybridblack
+
+
+class UnicornBlackGroup():
+    """class for running several g.tec Unicorn Hybrid Black devices at once
+    """
+
+    def __init__(self):
+        self.channellabels = 'FZ, C3, CZ, C4, PZ, O1, OZ, O2, AccelX, AccelY, AccelZ, GyroX, GyroY, GyroZ, Battery, Sample'
+        self.samplefreq = 250.0
+        self.printoutput = False
+        self.durability = 'interval' # interval, trial, chunk, or close (see UnicornBlackWriter)
+        self.syncinterval = 5.0
+        self.clockwindow = 100 # clock readings kept per device for the offset estimate
+        self.clockinterval = 0.1 # seconds between clock readings
+        self.framelength = 1 # samples per frame, readings further than one frame from the median are rejected
+        self.deviceIDs = []
+        self.devices = []
+        self.logfilenames = []
+        self.logfilename = None
+        self.logformat = 'csv'
+        self._origins = []
+        self._rejected = []
+        self._clocklock = Lock()
+        self._killclock = Event()
+        self._cthread = None
+        self._combined = None
+        self._timetemp = None
+
+    def connect(self, deviceIDs, rollingspan=3.0, logfilename='default', framelength=1, logformat='csv'):
+        """Starts one acquisition process for each device
+
+        deviceIDs   --  list of device serials
+        logfilename --  session name, each device records to logfilename_deviceID
+        """
+        self.deviceIDs = list(deviceIDs)
+        self.logfilename = logfilename
+        self.logformat = logformat
+        self.framelength = framelength
+        self.devices = []
+        self.logfilenames = []
+        self._origins = []
+        self._rejected = []
+        self._combined = None
+        for deviceID in self.deviceIDs:
+            UnicornBlack = unicornhybridblack.UnicornBlackProcess()
+            UnicornBlack.channellabels = self.channellabels
+            UnicornBlack.printoutput = self.printoutput
+            UnicornBlack.durability = self.durability
+            UnicornBlack.syncinterval = self.syncinterval
+            devicefilename = '%s_%s' % (logfilename, deviceID)
+            UnicornBlack.connect(deviceID=deviceID, rollingspan=rollingspan, logfilename=devicefilename, framelength=framelength, logformat=logformat)
+            self.devices.append(UnicornBlack)
+            self.logfilenames.append(devicefilename)
+            self._origins.append(collections.deque(maxlen=int(self.clockwindow)))
+            self._rejected.append(0)
+        self._killclock.clear()
+        self._cthread = Thread(target=self._track_clocks, args=[], daemon=True)
+        self._cthread.name = 'groupclocks'
+        self._cthread.start()
+
+    def startrecording(self):
+        timetemp = str(datetime.now()).split()
+        self._timetemp = timetemp[0] + 'T' + timetemp[1]
+        for UnicornBlack in self.devices:
+            UnicornBlack.startrecording()
+        self._log_session()
+
+    def disconnect(self):
+        if self._cthread is not None:
+            self._killclock.set()
+            self._cthread.join()
+            self._cthread = None
+        offsets = self.check_clocks()
+        for UnicornBlack in self.devices:
+            UnicornBlack.disconnect()
+        if self._timetemp is not None:
+            self._log_session(offsets) # final offsets, estimated over the whole session
+        if self.printoutput:
+            print("Disconnected from %d devices." % len(self.devices))
+
+    def mark_event(self, event):
+        # one timestamp for every device, each resolves it against its own samples
+        timestamp = time.perf_counter_ns()
+        for UnicornBlack in self.devices:
+            UnicornBlack.mark_event(event, timestamp=timestamp)
+
+    def safe_to_log(self, boolsafe=True):
+        """Parameter to change logging settings
+        """
+        for UnicornBlack in self.devices:
+            UnicornBlack.safe_to_log(boolsafe)
+
+    def check_clocks(self):
+        """Returns the clock offset of each device in seconds, relative to the first device
+
+        a positive offset means the device started counting later than the first device
+        """
+        self._sample_clocks()
+        origins = self._clock_origins()
+        if None in origins:
+            offsets = [0.0 for origin in origins] # not every device has delivered a sample yet
+        else:
+            offsets = [float(origin - origins[0]) / 1000000000.0 for origin in origins]
+        if self.printoutput:
+            print('Device clock offsets: %s seconds.' % ', '.join(['%0.4f' % offset for offset in offsets]))
+        return offsets
+
+    def _sample_clocks(self):
+        # adds one origin estimate for every device that has delivered a sample
+        frameduration = max(int(self.framelength), 1) * 1000000000.0 / self.samplefreq
+        for incrX, UnicornBlack in enumerate(self.devices):
+            clock = UnicornBlack.check_clock()
+            if (clock['arrival'] > 0):
+                origin = clock['arrival'] - (clock['counter'] * 1000000000.0 / self.samplefreq)
+                self._clocklock.acquire(True)
+                origins = self._origins[incrX]
+                if (len(origins) >= 3) and (abs(origin - numpy.median(origins)) > frameduration):
+                    self._rejected[incrX] = self._rejected[incrX] + 1
+                    if (self._rejected[incrX] >= origins.maxlen):
+                        origins.clear() # the clock has really moved, start the estimate again
+                        self._rejected[incrX] = 0
+                else:
+                    origins.append(origin)
+                    self._rejected[incrX] = 0
+                self._clocklock.release()
+
+    def _track_clocks(self):
+        while not self._killclock.wait(self.clockinterval):
+            self._sample_clocks()
+
+    def _clock_origins(self):
+        # host perf_counter_ns() time at which each device counter was zero
+        origins = []
+        self._clocklock.acquire(True)
+        for incrX in range(len(self.devices)):
+            if (len(self._origins[incrX]) > 0):
+                origins.append(min(self._origins[incrX]))
+            else:
+                origins.append(None)
+        self._clocklock.release()
+        return origins
+
+    def sample_data(self, aligned=True):
+        """Returns the rolling windows of all devices as a (devices x samples x channels) array
+
+        aligned     --  trim each window so the rows of every device cover the same host time,
+                        otherwise each window is returned as it is
+
+        the windows are read straight into one preallocated array that is reused by the next
+        call, so copy the result to keep it
+        """
+        if self._combined is None:
+            first = self.devices[0].sample_data()
+            self._combined = numpy.zeros((len(self.devices),) + first.shape, dtype=numpy.float32)
+        combined = self._combined
+        for incrX, UnicornBlack in enumerate(self.devices):
+            UnicornBlack.sample_data(out=combined[incrX])
+        if not aligned:
+            return combined
+
+        origins = self._clock_origins()
+        if None in origins:
+            origins = [0.0 for origin in origins]
+        counterchannel = combined.shape[2] - 2
+        latest = [origins[incrX] + (combined[incrX,-1,counterchannel] * 1000000000.0 / self.samplefreq) for incrX in range(len(self.devices))]
+        commonend = min(latest)
+        trim = [int(round((latest[incrX] - commonend) * self.samplefreq / 1000000000.0)) for incrX in range(len(self.devices))]
+        rows = max(combined.shape[1] - max(trim), 0)
+        for incrX in range(len(self.devices)):
+            if (trim[incrX] > 0) and (rows > 0):
+                # shift the aligned rows of this device to the end of its window in place
+                stop = combined.shape[1] - trim[incrX]
+                combined[incrX,(combined.shape[1] - rows):,:] = combined[incrX,(stop - rows):stop,:]
+        return combined[:,(combined.shape[1] - rows):,:]
+
+    def check_battery(self):
+        return [UnicornBlack.check_battery() for UnicornBlack in self.devices]
+
+    def check_samples(self):
+        return [UnicornBlack.check_samples() for UnicornBlack in self.devices]
+
+    def check_logging(self):
+        return [UnicornBlack.check_logging() for UnicornBlack in self.devices]
+
+    def _log_session(self, offsets=None):
+        """Writes the session header that ties the device recordings together
+        """
+        if offsets is None:
+            offsets = self.check_clocks()
+        header = {'collect': 'UnicornPy_' + unicornhybridblack.UnicornBlackCollectVersion,
+                  'date': self._timetemp,
+                  'filename': self.logfilename,
+                  'logformat': self.logformat,
+                  'samplerate': float(self.samplefreq),
+                  'devices': [{'device': self.deviceIDs[incrX],
+                               'filename': os.path.basename(self.logfilenames[incrX]),
+                               'clockoffset': offsets[incrX]} for incrX in range(len(self.devices))]}
+        headerfile = open('%s_session.json' % (self.logfilename), 'w')
+        json.dump(header, headerfile, indent=4)
+        headerfile.flush() # internal buffer to RAM
+        os.fsync(headerfile.fileno()) # RAM file cache to disk
+        headerfile.close()
+
+
+# # # # #
+# DEBUG #
+if __name__ == "__main__":
+
+    UnicornBlack = UnicornBlackGroup()
+    UnicornBlack.printoutput = True
+    UnicornBlack.connect(deviceIDs=['UN-2019.05.51', 'UN-2019.05.52'], rollingspan=3, logfilename='recordeddata_group')
+    UnicornBlack.startrecording()
+    for incrX in range(5):
+        time.sleep(1.0)
+        UnicornBlack.mark_event(incrX + 1)
+    print(UnicornBlack.sample_data().shape)
+    UnicornBlack.check_clocks()
+    UnicornBlack.check_samples()
+    UnicornBlack.disconnect()
@@ -0,0 +1,264 @@
+# unicornhybridblackmonitor: class to check the signal quality without the viewer
+#
+"""
+UnicornBlackMonitor runs UnicornBlackCheckSignal on the live data at a fixed cadence and
+reports the result without a figure
+
+    the latest status is served as JSON over a small local HTTP server, so one dashboard
+    can poll many recording stations
+        http://127.0.0.1:8765/            latest status
+        http://127.0.0.1:8765/timeline    recent statuses, oldest first
+    every check is also appended to a compact quality timeline file (.csv), and kept in a
+    UnicornBlackQualityHistory (qualityhistory) that reports trends and degraded channels
+
+    the data comes from a device connected through UnicornBlackProcess, or from any object
+    with a sample_data() method, such as a UnicornBlackInlet following a published recording
+
+Working notes
+- the HTTP server only answers GET requests and binds to 127.0.0.1 unless host is changed
+- run from an external terminal, multiprocessing does not play nicely with Spyder
+
+@author: Matt Pontifex
+"""
+
+import os
+import json
+import time
+import collections
+import numpy
+import http.server
+from threading import Thread, Lock
+from datetime import datetime
+
+try:
+    import unicornhybridblack as unicornhybridblack
+except:
+    import Engine.unicornhybridblack as unicornhybridblack
+
+
+class UnicornBlackMonitor():
+    """headless signal quality monitor with a JSON status endpoint
+    """
+
+    def __init__(self):
+        self.unicorn = 'UN-2019.05.51'
+        self.channellabels = ['FZ', 'C3', 'CZ', 'C4', 'PZ', 'O1', 'OZ', 'O2']
+        self.rollingspan = 5.0 # seconds of data evaluated on each check
+        self.interval = 1.0 # seconds between checks
+        self.host = '127.0.0.1'
+        self.port = 8765 # None to run without the HTTP server
+        self.timelinefile = 'default' # _quality.csv is appended, None to skip the timeline
+        self.timelinelength = 3600 # statuses kept for /timeline
+        self.highpassfilter = 1.0 # hz
+        self.lowpassfilter = 26.0 # hz
+        self.controlband = [20, 40] # hz
+        self.noiseband = [58, 62] # hz
+        self.printoutput = False
+        self.source = None
+        self.UnicornBlack = None
+        self.status = {}
+        self.timeline = collections.deque(maxlen=int(self.timelinelength))
+        self._statuslock = Lock()
+        self._monitoring = False
+        self._server = None
+        self._timeline = None
+
+    def connect(self, deviceID=None, source=None):
+        """Connects to the device, or monitors an existing source
+
+        source      --  object with a sample_data() method, a UnicornBlackProcess is
+                        connected to deviceID if None
+        """
+        if source is None:
+            if deviceID is not None:
+                self.unicorn = deviceID
+            self.UnicornBlack = unicornhybridblack.UnicornBlackProcess()
+            self.UnicornBlack.printoutput = self.printoutput
+            self.UnicornBlack.connect(deviceID=self.unicorn, rollingspan=self.rollingspan)
+            source = self.UnicornBlack
+        self.source = source
+
+        self.datacheck = unicornhybridblack.UnicornBlackCheckSignal()
+        self.datacheck.nbchan = len(self.channellabels)
+        self.datacheck.controlband = self.controlband
+        self.datacheck.noiseband = self.noiseband
+        self.datacheck.highpassfilter = self.highpassfilter
+        self.datacheck.lowpassfilter = self.lowpassfilter
+        self.qualityhistory = unicornhybridblack.UnicornBlackQualityHistory(nbchan=len(self.channellabels), channellabels=self.channellabels)
+        self.datacheck.history = self.qualityhistory
+        self.timeline = collections.deque(maxlen=int(self.timelinelength))
+
+    def start(self):
+        """Checks the signal every interval seconds from a background thread and starts serving
+        """
+        if self.timelinefile is not None:
+            self._start_timeline()
+        if self.port is not None:
+            self._server = http.server.ThreadingHTTPServer((self.host, int(self.port)), _UnicornBlackMonitorHandler)
+            self._server.monitor = self
+            self.port = self._server.server_address[1] # port 0 picks a free port
+            self._sthread = Thread(target=self._server.serve_forever, args=[], daemon=True)
+            self._sthread.name = 'qualityserver'
+            self._sthread.start()
+            if self.printoutput:
+                print('Signal quality available at http://%s:%d/' % (self.host, self.port))
+        self._monitoring = True
+        self._mthread = Thread(target=self._monitor, args=[], daemon=True)
+        self._mthread.name = 'qualitymonitor'
+        self._mthread.start()
+
+    def stop(self):
+        self._monitoring = False
+        self._mthread.join()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._timeline is not None:
+            self._timeline.close()
+            self._timeline = None
+
+    def disconnect(self):
+        if self._monitoring:
+            self.stop()
+        if self.UnicornBlack is not None:
+            self.UnicornBlack.disconnect()
+            self.UnicornBlack = None
+
+    def run(self):
+        """Monitors until interrupted with Ctrl+C
+        """
+        self.start()
+        try:
+            while True:
+                time.sleep(1.0)
+        except KeyboardInterrupt:
+            pass
+        self.disconnect()
+
+    def _monitor(self):
+        nextcheck = time.perf_counter()
+        while self._monitoring:
+            try:
+                self.check()
+            except Exception as error:
+                if self.printoutput:
+                    print('Signal check failed: %s' % str(error))
+            nextcheck = max(nextcheck + self.interval, time.perf_counter()) # fixed cadence, without catching up
+            time.sleep(max(nextcheck - time.perf_counter(), 0.0))
+
+    def check(self):
+        """Evaluates the current window and returns the status
+        """
+        sampledata = numpy.array(self.source.sample_data(), copy=True)
+        counters = sampledata[:,-2]
+        sampledata = sampledata[counters > 0,:] # rows not filled yet hold zeros
+        status = {'time': str(datetime.now()).replace(' ', 'T'), 'device': str(getattr(self.source, 'deviceID', self.unicorn)), 'windowsamples': int(sampledata.shape[0])}
+        if (sampledata.shape[0] < (self.rollingspan * self.datacheck._samplefreq / 2.0)):
+            status['state'] = 'waiting' # not enough data for a stable estimate yet
+            channels = []
+        else:
+            self.datacheck.data = sampledata
+            self.datacheck.check()
+            status['state'] = 'ok'
+            status['battery'] = float(sampledata[-1,-3])
+            pointstdtrend, freqratiotrend = self.qualityhistory.trend()
+            channels = []
+            for cC in range(len(self.channellabels)):
+                channels.append({'label': self.channellabels[cC], 'pointstd': round(float(self.datacheck.pointstd[cC]), 2), 'freqratio': round(float(self.datacheck.freqratio[cC]), 2),
+                                 'pointstdtrend': round(float(pointstdtrend[cC]), 2), 'freqratiotrend': round(float(freqratiotrend[cC]), 2)})
+            status['degraded'] = self.qualityhistory.degraded_channels()
+        status['channels'] = channels
+        if hasattr(self.source, 'check_samples'):
+            status.update({'dropped': 0, 'duplicate': 0})
+            status.update(self.source.check_samples())
+        elif hasattr(self.source, 'check_stream'):
+            status['lost'] = int(self.source.check_stream()['lost'])
+
+        self._statuslock.acquire(True)
+        self.status = status
+        self.timeline.append(status)
+        self._statuslock.release()
+        if (status['state'] == 'ok') and (self._timeline is not None):
+            self._log_timeline(status)
+        if self.printoutput:
+            print(self.summary(status))
+        return status
+
+    def summary(self, status=None):
+        """Returns a one line description of a status
+        """
+        if status is None:
+            status = self.check_status()
+        if (status.get('state') != 'ok'):
+            return 'Waiting for data.'
+        return 'Battery %d%%, %d dropped. ' % (status['battery'], status.get('dropped', 0)) + ', '.join(['%s %0.1f' % (channel['label'], channel['pointstd']) for channel in status['channels']])
+
+    def check_status(self):
+        """Returns the latest status
+        """
+        self._statuslock.acquire(True)
+        status = self.status
+        self._statuslock.release()
+        return status
+
+    def check_timeline(self):
+        """Returns the statuses kept in memory, oldest first
+        """
+        self._statuslock.acquire(True)
+        timeline = list(self.timeline)
+        self._statuslock.release()
+        return timeline
+
+    def _start_timeline(self):
+        filename = '%s_quality.csv' % (self.timelinefile)
+        newfile = not os.path.isfile(filename)
+        self._timeline = open(filename, 'a')
+        if newfile:
+            header = ['time', 'battery', 'dropped'] + ['%s_std' % label for label in self.channellabels] + ['%s_ratio' % label for label in self.channellabels]
+            self._timeline.write(', '.join(header) + '\n')
+            self._timeline.flush()
+
+    def _log_timeline(self, status):
+        # one line per check: time, battery, dropped samples, then pointstd and freqratio of each channel
+        values = [status['time'], '%d' % status['battery'], '%d' % status.get('dropped', status.get('lost', 0))]
+        values = values + ['%0.1f' % channel['pointstd'] for channel in status['channels']]
+        values = values + ['%0.1f' % channel['freqratio'] for channel in status['channels']]
+        self._timeline.write(', '.join(values) + '\n')
+        self._timeline.flush()
+
+
+class _UnicornBlackMonitorHandler(http.server.BaseHTTPRequestHandler):
+    # answers GET / with the latest status and GET /timeline with the statuses kept in memory
+
+    def do_GET(self):
+        monitor = self.server.monitor
+        path = self.path.split('?')[0].rstrip('/')
+        if (path == '') or (path == '/status'):
+            content = monitor.check_status()
+        elif (path == '/timeline'):
+            content = monitor.check_timeline()
+        else:
+            self.send_error(404)
+            return
+        body = json.dumps(content).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # keep the console for the monitor output
+
+
+# # # # #
+# DEBUG #
+if __name__ == "__main__":
+
+    monitor = UnicornBlackMonitor()
+    monitor.printoutput = True
+    monitor.timelinefile = 'recordeddata'
+    monitor.connect(deviceID='UN-2019.05.51')
+    monitor.run()
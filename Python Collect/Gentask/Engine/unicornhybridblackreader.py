@@ -0,0 +1,244 @@
+# unicornhybridblackreader: classes to read data recorded with the unicornhybridblack
+#
+"""
+UnicornBlackReader provides lazy access to .csv or binary (.bin) recordings
+
+Samples are exposed as a (samples x channels) float32 array that is only read
+from disk when it is sliced. Binary recordings are memory mapped directly, while
+.csv recordings are converted once into a .npy cache kept in a unicornreader_cache
+folder next to the recording. Times are measured with the sample counter, so dropped
+samples do not shift the time of the samples that follow them.
+
+Working notes
+- the device does not need to be connected, so this module can be used for analysis
+  on any machine
+
+@author: Matt Pontifex
+"""
+
+import os
+import json
+import itertools
+import numpy
+
+# event table of a recording: sample counter latency and event code for each marker, the fractional
+# sample offset of the marker past that latency, and the time.perf_counter_ns() timestamp
+# the acquisition and stream modules import this definition so every copy of the layout matches
+UnicornBlackEventType = numpy.dtype([('latency', '<i8'), ('event', '<i4'), ('offset', '<f8'), ('timestamp', '<i8')])
+
+class UnicornBlackReader():
+    """class for reading a recording from the g.tec Unicorn Hybrid Black
+    """
+
+    def __init__(self, filename=None):
+
+        self.filename = None
+        self.logformat = None
+        self.collect = None
+        self.device = None
+        self.samplerate = 250.0
+        self.channels = 0
+        self.date = None
+        self.channellabels = []
+        self.headerlines = 7
+        self.cachechunksize = 50000 # rows converted per pass when building the .csv cache
+        self.cachefolder = None # folder of the .csv cache, unicornreader_cache next to the recording if None
+        self._data = None
+        self._events = None
+
+        if filename is not None:
+            self.open(filename)
+
+    def open(self, filename):
+        """Parses the recording header without reading any samples
+
+        filename    --  recording name with or without the .csv, .bin, or .json extension
+        """
+        basename, extension = os.path.splitext(filename)
+        if extension.lower() not in ['.csv', '.csve', '.bin', '.bine', '.json', '.npy']:
+            basename = filename
+        self.filename = basename
+        self._data = None
+        self._events = None
+
+        if os.path.isfile('%s.json' % (self.filename)):
+            self.logformat = 'binary'
+            headerfile = open('%s.json' % (self.filename), 'r')
+            header = json.load(headerfile)
+            headerfile.close()
+            self.collect = header['collect']
+            self.device = header['device']
+            self.samplerate = float(header['samplerate'])
+            self.channels = int(header['channels'])
+            self.date = header['date']
+            self.channellabels = header['channellabels']
+            self._dtype = header['dtype']
+            self._datafile = os.path.join(os.path.dirname(self.filename), header['datafile'])
+            self._eventfile = os.path.join(os.path.dirname(self.filename), header['eventfile'])
+            self._eventdtype = numpy.dtype([tuple(x) for x in header['eventdtype']])
+        elif os.path.isfile('%s.csv' % (self.filename)):
+            self.logformat = 'csv'
+            header = {}
+            logfile = open('%s.csv' % (self.filename), 'r')
+            for incrX in range(self.headerlines - 1):
+                line = logfile.readline().rstrip('\r\n')
+                key, value = line.split('=', 1)
+                header[key.strip('. ')] = value.strip()
+            self.channellabels = [x.strip() for x in logfile.readline().rstrip('\r\n').split(',')]
+            logfile.close()
+            self.collect = header['collect']
+            self.device = header['device']
+            self.samplerate = float(header['samplerate'])
+            self.channels = int(header['channels'])
+            self.date = header['date']
+            self._dtype = '<f4'
+            self._datafile = '%s.csv' % (self.filename)
+            self._eventfile = '%s.csve' % (self.filename)
+        else:
+            raise IOError("No recording found for '%s'." % filename)
+
+    @property
+    def data(self):
+        """(samples x channels) array backed by the file on disk
+        """
+        if self._data is None:
+            if (self.logformat == 'binary'):
+                rows = int(os.path.getsize(self._datafile) / (numpy.dtype(self._dtype).itemsize * self.channels))
+                self._data = numpy.memmap(self._datafile, dtype=self._dtype, mode='r', shape=(rows, self.channels))
+            else:
+                self._data = numpy.load(self._csvcache(), mmap_mode='r')
+        return self._data
+
+    @property
+    def events(self):
+        """structured array of event markers with latency (sample counter) and event fields
+        
+        recordings made since fractional markers were added also carry offset (fraction of a
+        sample past latency) and timestamp (perf_counter_ns) fields, older files report zeros
+        """
+        if self._events is None:
+            eventdtype = UnicornBlackEventType
+            if (self.logformat == 'binary'):
+                self._events = numpy.zeros(0, dtype=self._eventdtype)
+                if os.path.isfile(self._eventfile):
+                    self._events = numpy.fromfile(self._eventfile, dtype=self._eventdtype)
+            else:
+                self._events = numpy.zeros(0, dtype=eventdtype)
+                if os.path.isfile(self._eventfile):
+                    eventlines = []
+                    eventfile = open(self._eventfile, 'r')
+                    for line in itertools.islice(eventfile, 4, None):
+                        line = line.strip()
+                        if (len(line) > 0):
+                            fields = line.split(',') + ['0', '0']
+                            eventlines.append((int(float(fields[0])), int(float(fields[1])), float(fields[2]), int(float(fields[3]))))
+                    eventfile.close()
+                    self._events = numpy.array(eventlines, dtype=eventdtype)
+        return self._events
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __getitem__(self, channels):
+        # reader['CZ'] or reader[['CZ', 'PZ']] returns the full time course of those channels
+        return self.select(channels=channels)
+
+    def channelindex(self, channels):
+        """Converts channel labels (or indices) into column indices
+        """
+        if isinstance(channels, (str, int, numpy.integer)):
+            channels = [channels]
+        index = []
+        for channel in channels:
+            if isinstance(channel, str):
+                index.append([x.upper() for x in self.channellabels].index(channel.strip().upper()))
+            else:
+                index.append(int(channel))
+        return index
+
+    def timeindex(self, timerange):
+        """Converts a [start, stop] range in seconds from the start of the recording into row indices
+
+        the rows are found by sample counter, so a range after dropped samples still covers
+        the samples recorded at that time
+        """
+        start = 0
+        stop = len(self)
+        if (timerange is not None) and (stop > 0):
+            firstcounter = float(self.data[0, self.channels - 1])
+            if timerange[0] is not None:
+                start = int(self.latencyindex(firstcounter + round(float(timerange[0]) * self.samplerate)))
+            if timerange[1] is not None:
+                stop = int(self.latencyindex(firstcounter + round(float(timerange[1]) * self.samplerate)))
+        return start, stop
+
+    def select(self, channels=None, timerange=None):
+        """Returns a (samples x channels) float32 copy of the requested channels and time range
+
+        channels    --  channel label, index, or list of either (all channels if None)
+        timerange   --  [start, stop] in seconds from the start of the recording (whole file if None)
+        """
+        start, stop = self.timeindex(timerange)
+        if channels is None:
+            return numpy.array(self.data[start:stop,:], dtype=numpy.float32)
+        return numpy.array(self.data[start:stop, self.channelindex(channels)], dtype=numpy.float32)
+
+    def latencyindex(self, latency):
+        """Converts sample counter latencies (as stored with the events) into row indices
+        """
+        samplecounter = self.data[:, self.channels - 1]
+        return numpy.searchsorted(samplecounter, latency)
+    
+    def eventtimes(self):
+        """Returns the time of every event in seconds from the start of the recording,
+        including the fractional sample offset of each marker
+        """
+        events = self.events
+        offset = numpy.zeros(len(events))
+        if 'offset' in events.dtype.names:
+            offset = events['offset']
+        if (len(self) == 0):
+            return offset / self.samplerate
+        return (events['latency'] - float(self.data[0, self.channels - 1]) + offset) / self.samplerate
+
+    def _csvcache(self):
+        # convert the .csv once into a .npy file that can be memory mapped
+        cachefolder = self.cachefolder
+        if cachefolder is None:
+            cachefolder = os.path.join(os.path.dirname(self.filename), 'unicornreader_cache')
+        if not os.path.isdir(cachefolder):
+            os.makedirs(cachefolder)
+        cachefile = os.path.join(cachefolder, '%s.npy' % (os.path.basename(self.filename)))
+        if os.path.isfile(cachefile):
+            if (os.path.getmtime(cachefile) >= os.path.getmtime(self._datafile)):
+                return cachefile
+
+        logfile = open(self._datafile, 'r')
+        rows = sum(1 for line in logfile if len(line.strip()) > 0) - self.headerlines
+        logfile.seek(0)
+        for incrX in range(self.headerlines):
+            logfile.readline()
+
+        cache = numpy.lib.format.open_memmap(cachefile, mode='w+', dtype=self._dtype, shape=(rows, self.channels))
+        row = 0
+        while (row < rows):
+            lines = [line for line in itertools.islice(logfile, self.cachechunksize) if len(line.strip()) > 0]
+            if (len(lines) == 0):
+                break
+            chunk = numpy.loadtxt(lines, delimiter=',', dtype=numpy.float32, ndmin=2)
+            cache[row:row + chunk.shape[0],:] = chunk
+            row = row + chunk.shape[0]
+        logfile.close()
+        cache.flush()
+        del cache
+        return cachefile
+
+
+# # # # #
+# DEBUG #
+if __name__ == "__main__":
+
+    recording = UnicornBlackReader(os.path.join('..', '..', 'Raw', 'example626'))
+    print('%s recorded %d samples at %0.1f Hz' % (recording.device, len(recording), recording.samplerate))
+    print('Channel OZ between 10 and 12 seconds: %d samples' % recording.select(channels='OZ', timerange=[10.0, 12.0]).shape[0])
+    print('Events at rows: %s' % str(recording.latencyindex(recording.events['latency'])))
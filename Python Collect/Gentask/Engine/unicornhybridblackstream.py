@@ -0,0 +1,380 @@
+# unicornhybridblackstream: classes to publish and receive unicornhybridblack data over a network socket
+#
+"""
+UnicornBlackOutlet publishes samples and event markers over TCP or UDP
+
+UnicornBlackInlet subscribes to an outlet and rebuilds the rolling window on the other side
+
+This follows the idea of the Lab Streaming Layer: analysis or BCI processes, on another
+core or another machine, can follow the acquisition without touching the acquisition
+process. The outlet is started with UnicornBlackThreads.publish(), and any number of
+inlets can subscribe to it.
+
+Every packet starts with a 32 byte little endian header
+
+    magic       4 bytes     b'UBLK'
+    kind        1 byte      0 samples, 1 markers, 2 stream information (json)
+    padding     3 bytes
+    sequence    uint64      packet number within its kind, gaps mean lost UDP packets
+    timestamp   int64       time.perf_counter_ns() on the sending machine
+    rows        uint32      samples or markers in the packet (bytes of json for kind 2)
+    channels    uint32      channels per sample (0 for markers and information)
+
+followed by rows x channels float32 samples, rows marker records (latency int64, event int32,
+offset float64, timestamp int64), or the json text.
+
+TCP subscribers connect to the outlet port. UDP subscribers send any datagram to the
+outlet port and are then sent every packet, so each packet is limited to maxrows samples.
+
+Working notes
+- the module does not depend on UnicornPy, so inlets can run on machines without the device
+- timestamps are from the clock of the sending machine, only compare them on the same host
+
+@author: Matt Pontifex
+"""
+
+import json
+import time
+import math
+import queue
+import socket
+import struct
+import numpy
+from threading import Thread, Lock
+try:
+    import unicornhybridblackreader as unicornhybridblackreader
+except:
+    import Engine.unicornhybridblackreader as unicornhybridblackreader
+
+UnicornBlackStreamHeader = struct.Struct('<4sB3xQqII')
+UnicornBlackStreamMagic = b'UBLK'
+UnicornBlackStreamEventType = unicornhybridblackreader.UnicornBlackEventType # markers are sent in the recording layout
+
+
+class UnicornBlackOutlet():
+    """publishes samples and markers to every subscribed inlet
+
+    push_samples() and push_markers() only place the data in a queue, the sender thread
+    batches whatever is waiting into packets so the acquisition thread never waits on
+    the network. When the queue is full the newest data is dropped and counted.
+    """
+
+    def __init__(self, port=16500, host='127.0.0.1', protocol='tcp', info=None, maxqueue=1024, maxrows=256):
+        self.port = int(port)
+        self.host = host
+        self.protocol = protocol.lower()
+        self.info = info # dictionary describing the stream (device, samplerate, channellabels)
+        if self.info is None:
+            self.info = {}
+        self.maxrows = int(maxrows) # samples per packet
+        self.droppedframes = 0
+        self.packetssent = 0
+        self._sequence = [0, 0, 0]
+        self._queue = queue.Queue(maxsize=int(maxqueue))
+        self._subscribers = []
+        self._subscriberlock = Lock()
+        self._publishing = True
+
+        if (self.protocol == 'udp'):
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        else:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((self.host, self.port))
+        self.port = self._socket.getsockname()[1] # port 0 picks a free port
+        self._socket.settimeout(0.1)
+        if (self.protocol == 'tcp'):
+            self._socket.listen(8)
+
+        self._subscribethread = Thread(target=self._subscribe, args=[], daemon=True)
+        self._subscribethread.name = 'outletsubscriber'
+        self._subscribethread.start()
+        self._sendthread = Thread(target=self._send, args=[], daemon=True)
+        self._sendthread.name = 'outletsender'
+        self._sendthread.start()
+
+    def push_samples(self, sampledata, timestamp=None):
+        # (samples x channels) float32 frame, called from the acquisition thread
+        if timestamp is None:
+            timestamp = time.perf_counter_ns()
+        try:
+            self._queue.put_nowait((0, sampledata, timestamp))
+        except queue.Full:
+            self.droppedframes = self.droppedframes + 1
+
+    def push_markers(self, markers, timestamp=None):
+        # structured array of resolved markers
+        if timestamp is None:
+            timestamp = time.perf_counter_ns()
+        try:
+            self._queue.put_nowait((1, markers, timestamp))
+        except queue.Full:
+            self.droppedframes = self.droppedframes + 1
+
+    def subscribers(self):
+        return len(self._subscribers)
+
+    def close(self):
+        self._queue.put(None) # poison pill approach
+        self._sendthread.join()
+        self._publishing = False
+        self._subscribethread.join()
+        self._subscriberlock.acquire(True)
+        if (self.protocol == 'tcp'):
+            for subscriber in self._subscribers:
+                try:
+                    subscriber.close()
+                except:
+                    pass
+        self._subscribers = []
+        self._subscriberlock.release()
+        self._socket.close()
+
+    def _packet(self, kind, payload, rows, channels, timestamp):
+        header = UnicornBlackStreamHeader.pack(UnicornBlackStreamMagic, kind, self._sequence[kind], timestamp, rows, channels)
+        self._sequence[kind] = self._sequence[kind] + 1
+        return header + payload
+
+    def _infopacket(self):
+        payload = json.dumps(self.info).encode('utf-8')
+        return self._packet(2, payload, len(payload), 0, time.perf_counter_ns())
+
+    def _subscribe(self):
+        # accept TCP connections or register UDP subscribers
+        while self._publishing:
+            try:
+                if (self.protocol == 'udp'):
+                    request, address = self._socket.recvfrom(64)
+                    self._subscriberlock.acquire(True)
+                    if address not in self._subscribers:
+                        self._subscribers.append(address)
+                    self._subscriberlock.release()
+                    self._socket.sendto(self._infopacket(), address)
+                else:
+                    connection, address = self._socket.accept()
+                    connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    connection.sendall(self._infopacket())
+                    self._subscriberlock.acquire(True)
+                    self._subscribers.append(connection)
+                    self._subscriberlock.release()
+            except (socket.timeout, BlockingIOError):
+                pass
+            except OSError:
+                if self._publishing:
+                    time.sleep(0.1)
+
+    def _broadcast(self, packet):
+        self._subscriberlock.acquire(True)
+        for subscriber in list(self._subscribers):
+            try:
+                if (self.protocol == 'udp'):
+                    self._socket.sendto(packet, subscriber)
+                else:
+                    subscriber.sendall(packet)
+            except OSError:
+                # subscriber has gone away
+                self._subscribers.remove(subscriber)
+        self._subscriberlock.release()
+        self.packetssent = self.packetssent + 1
+
+    def _send(self):
+        publishing = True
+        while publishing:
+            try:
+                batch = [self._queue.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                # Poison pill means shutdown, still send what arrived before it
+                batch = batch[0:batch.index(None)]
+                publishing = False
+
+            for kind in [0, 1]:
+                items = [item for item in batch if (item[0] == kind)]
+                if (len(items) == 0) or (len(self._subscribers) == 0):
+                    continue
+                timestamp = items[-1][2]
+                data = numpy.concatenate([item[1] for item in items])
+                if (kind == 0):
+                    data = numpy.ascontiguousarray(data, dtype='<f4')
+                    for start in range(0, len(data), self.maxrows):
+                        chunk = data[start:start + self.maxrows]
+                        self._broadcast(self._packet(0, chunk.tobytes(), chunk.shape[0], chunk.shape[1], timestamp))
+                else:
+                    data = data.astype(UnicornBlackStreamEventType)
+                    self._broadcast(self._packet(1, data.tobytes(), len(data), 0, timestamp))
+
+
+class UnicornBlackInlet():
+    """subscribes to a UnicornBlackOutlet and keeps the most recent samples in a ring buffer
+    """
+
+    def __init__(self, port=16500, host='127.0.0.1', protocol='tcp', rollingspan=3.0):
+        self.port = int(port)
+        self.host = host
+        self.protocol = protocol.lower()
+        self.rollingspan = rollingspan
+        self.info = None
+        self.samplefreq = 250.0
+        self.packets = 0
+        self.lostpackets = 0
+        self.samples = 0
+        self.latency = 0.0 # seconds between sending and receiving the newest packet (same host only)
+        self.printoutput = False
+        self._buffer = None
+        self._index = 0
+        self._bufferlock = Lock()
+        self._events = []
+        self._nextsequence = [0, 0, 0]
+        self._receiving = False
+        self._socket = None
+
+    def connect(self, timeout=3.0):
+        """Subscribes to the outlet and waits up to timeout seconds for the stream information
+        """
+        if (self.protocol == 'udp'):
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+            self._socket.sendto(b'subscribe', (self.host, self.port))
+        else:
+            self._socket = socket.create_connection((self.host, self.port), timeout=timeout)
+        self._socket.settimeout(0.1)
+        self._receiving = True
+        self._rthread = Thread(target=self._receive, args=[], daemon=True)
+        self._rthread.name = 'inletreceiver'
+        self._rthread.start()
+
+        starttime = time.perf_counter()
+        while (self.info is None) and ((time.perf_counter() - starttime) < timeout):
+            time.sleep(0.01)
+        if self.printoutput and (self.info is not None):
+            print("Subscribed to '%s' on port %d." % (self.info.get('device', ''), self.port))
+        return self.info is not None
+
+    def disconnect(self):
+        self._receiving = False
+        self._rthread.join()
+        self._socket.close()
+
+    def sample_data(self):
+        # time ordered (samples x channels) float32 array of the rolling window
+        self._bufferlock.acquire(True)
+        if self._buffer is None:
+            datasample = numpy.zeros((0, 0), dtype=numpy.float32)
+        else:
+            datasample = numpy.concatenate((self._buffer[self._index:,:], self._buffer[0:self._index,:]), axis=0)
+        self._bufferlock.release()
+        return datasample
+
+    def events(self):
+        """Returns every marker received so far as a structured array
+        """
+        if (len(self._events) == 0):
+            return numpy.zeros(0, dtype=UnicornBlackStreamEventType)
+        return numpy.concatenate(self._events)
+
+    def check_stream(self):
+        """Returns the packets and samples received and the packets lost along the way
+        """
+        streamcheck = {'packets': int(self.packets), 'lost': int(self.lostpackets), 'samples': int(self.samples), 'latency': float(self.latency)}
+        if self.printoutput:
+            print('Inlet received %d packets (%d lost) holding %d samples.' % (streamcheck['packets'], streamcheck['lost'], streamcheck['samples']))
+        return streamcheck
+
+    def _push(self, sampledata):
+        # write rows at the rolling index, wrapping around the end of the buffer
+        self._bufferlock.acquire(True)
+        if (self._buffer is None) or (self._buffer.shape[1] != sampledata.shape[1]):
+            self._buffer = numpy.zeros((int(math.floor(float(self.rollingspan) * self.samplefreq)), sampledata.shape[1]), dtype=numpy.float32)
+            self._index = 0
+        rows = self._buffer.shape[0]
+        sampledata = sampledata[-rows:]
+        first = min(len(sampledata), rows - self._index)
+        self._buffer[self._index:self._index + first,:] = sampledata[0:first]
+        self._buffer[0:len(sampledata) - first,:] = sampledata[first:]
+        self._index = (self._index + len(sampledata)) % rows
+        self._bufferlock.release()
+
+    def _handle(self, header, payload):
+        magic, kind, sequence, timestamp, rows, channels = header
+        if (magic != UnicornBlackStreamMagic):
+            return
+        if (kind in [0, 1]):
+            if (sequence > self._nextsequence[kind]):
+                self.lostpackets = self.lostpackets + (sequence - self._nextsequence[kind])
+            self._nextsequence[kind] = sequence + 1
+        self.packets = self.packets + 1
+        self.latency = float(time.perf_counter_ns() - timestamp) / 1000000000.0
+        if (kind == 0):
+            sampledata = numpy.frombuffer(payload, dtype='<f4').reshape((rows, channels))
+            self._push(sampledata)
+            self.samples = self.samples + rows
+        elif (kind == 1):
+            self._events.append(numpy.frombuffer(payload, dtype=UnicornBlackStreamEventType).copy())
+        elif (kind == 2):
+            self.info = json.loads(payload.decode('utf-8'))
+            self.samplefreq = float(self.info.get('samplerate', self.samplefreq))
+
+    def _payloadsize(self, kind, rows, channels):
+        if (kind == 0):
+            return rows * channels * 4
+        if (kind == 1):
+            return rows * UnicornBlackStreamEventType.itemsize
+        return rows
+
+    def _receive(self):
+        pending = bytearray() # grows in place, parsed packets are removed from the front once per recv
+        while self._receiving:
+            try:
+                if (self.protocol == 'udp'):
+                    packet = self._socket.recv(65536)
+                    header = UnicornBlackStreamHeader.unpack_from(packet)
+                    self._handle(header, packet[UnicornBlackStreamHeader.size:])
+                    continue
+                received = self._socket.recv(262144)
+                if (len(received) == 0):
+                    break # outlet has closed
+                pending += received
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+
+            # split the TCP byte stream back into packets
+            offset = 0
+            while ((len(pending) - offset) >= UnicornBlackStreamHeader.size):
+                header = UnicornBlackStreamHeader.unpack_from(pending, offset)
+                packetsize = UnicornBlackStreamHeader.size + self._payloadsize(header[1], header[4], header[5])
+                if ((len(pending) - offset) < packetsize):
+                    break
+                self._handle(header, bytes(pending[(offset + UnicornBlackStreamHeader.size):(offset + packetsize)]))
+                offset = offset + packetsize
+            del pending[:offset]
+
+
+# # # # #
+# DEBUG #
+if __name__ == "__main__":
+
+    # loopback test: publish a synthetic stream and read it back
+    outlet = UnicornBlackOutlet(port=0, info={'device': 'loopback', 'samplerate': 250.0, 'channels': 17})
+    inlet = UnicornBlackInlet(port=outlet.port)
+    inlet.printoutput = True
+    inlet.connect()
+    for incrX in range(500):
+        frame = numpy.zeros((1, 17), dtype=numpy.float32)
+        frame[0,15] = incrX + 1
+        outlet.push_samples(frame)
+        if (incrX % 100 == 0):
+            outlet.push_markers(numpy.array([(incrX + 1, 1, 0.0, time.perf_counter_ns())], dtype=UnicornBlackStreamEventType))
+        time.sleep(0.001)
+    time.sleep(0.5)
+    inlet.check_stream()
+    print('Newest sample counter %d, %d markers received.' % (inlet.sample_data()[-1,15], len(inlet.events())))
+    inlet.disconnect()
+    outlet.close()
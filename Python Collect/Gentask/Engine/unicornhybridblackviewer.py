@@ -3,6 +3,14 @@
 """
 Working notes
 - Works best when run in external terminal
+- with blitting (the default) the axes backgrounds are cached on every full draw and only the
+  lines and spectrum fills are redrawn on each update; a full draw is requested only when a
+  channel label color or the battery label changes
+- with backgroundsampling (the default) a sampler thread pulls the data and runs the signal
+  checks, publishing each ready to plot frame through a set of three buffers (one being
+  filled, one ready, one on screen), so update() only swaps buffers and draws
+- with decimation (the default) the time plot is reduced to a min/max pair per pixel column of
+  the time axis, so spikes stay visible and the draw cost does not grow with the rolling span
 
 @author: Matt Pontifex
 """
@@ -14,6 +22,7 @@ from threading import Thread, Lock
 import matplotlib
 import matplotlib.pyplot
 import matplotlib.animation
+import matplotlib.collections
 from matplotlib.widgets import Button
 import matplotlib.ticker as ticker
 
@@ -41,7 +50,12 @@ class Viewer():
         self.trimspanlead = 0.5
         self.trimspantrail = 2.0
         self.channellabels = ['FZ', 'C3', 'CZ', 'C4', 'PZ', 'O1', 'OZ', 'O2']
-        self.updatetime = 200 # update every x ms
+        self.updatetime = 33 # update every x ms
+        self.blitting = True # redraw only the changing artists over cached axes backgrounds
+        self.backgroundsampling = True # pull and process the data in a separate thread
+        self.samplinginterval = 0.033 # shortest time between data pulls in seconds
+        self.decimation = True # reduce the time plot to a min/max pair per pixel column
+        self.qualitythresholds = [12, 16, 30, 60] # pointstd bins for the channel label colors
         self.updatetimelog = []
 
         self._linewidth = 0.5
@@ -140,8 +154,8 @@ class Viewer():
         self._rollingspanpoints = int(math.floor( float(self.rollingspan) * float(self.samplefreq) ))
         self.xtime = numpy.ndarray.tolist(numpy.linspace(0, self.rollingspan, self._rollingspanpoints))
         self._baselinerollingspan = int(math.floor(self._rollingspanpoints / float(5.0)))
-        self.xtimeticks = numpy.linspace(1,int(math.floor(self.rollingspan-1)),int(self.rollingspan-1)).tolist()
-        self.xtimeticks = [int(i) for i in self.xtimeticks] 
+        tickstep = max(1, int(math.ceil(self.rollingspan / 12.0))) # every second, fewer for long overview spans
+        self.xtimeticks = list(range(tickstep, int(math.floor(self.rollingspan)), tickstep))
         
         self.fig = matplotlib.pyplot.figure(figsize=[10, 6])
         self.fig.patch.set_facecolor(self.WindowColor)
@@ -250,6 +264,11 @@ class Viewer():
         self.datacheck.data = numpy.array(self.data, copy=True)   
         self.datacheck.check()
         self.freqxline = self.datacheck.freqdata[0]
+        
+        # every check from here on is kept, with the label color bins as thresholds
+        self.qualityhistory = unicornhybridblack.UnicornBlackQualityHistory(nbchan=self.numberOfAcquiredChannels, channellabels=self.channellabels)
+        self.qualityhistory.pointstdthresholds = self.qualitythresholds
+        self.datacheck.history = self.qualityhistory
                 
         noisesegs = [numpy.argmin(abs(numpy.subtract(self.freqxline, 55.0))), numpy.argmin(abs(numpy.subtract(self.freqxline, 66.0)))]
         self.switchsegs = [numpy.argmin(abs(numpy.subtract(self.freqxline, 25.0)))]
@@ -262,12 +281,143 @@ class Viewer():
         for cC in range(self.numberOfAcquiredChannels):
             line, = self.freqax.plot(self.freqxline, self.datacheck.psddata[cC], linewidth=0.4, color=self.colorpalet[cC]) 
             self.freqlines.append(line)
+        
+        self._prepdecimation()
+        self.fig.canvas.mpl_connect('resize_event', self._prepdecimation)
+        self._prepbuffers()
+        if self.blitting:
+            self._prepblit()
             
         # start sampler
-        #self._sampling = True
-        #self._sthread = Thread(target=self.updatesamples, args=[], daemon=False)
-        #self._sthread.name = 'samplestreamer'
-        #self._sthread.start()
+        if self.backgroundsampling:
+            self._sampling = True
+            self._sthread = Thread(target=self._sampler, args=[], daemon=True)
+            self._sthread.name = 'samplestreamer'
+            self._sthread.start()
+        
+    def _prepdecimation(self, *args):
+        # bins of the time plot, one min/max pair per pixel column of the time axis
+        xtime = numpy.asarray(self.xtime)
+        pixels = int(self.timeax.bbox.width)
+        if (not self.decimation) or (pixels < 1) or (len(xtime) <= (2 * pixels)):
+            self._decimation = (None, xtime)
+        else:
+            starts = numpy.unique(numpy.linspace(0, len(xtime), pixels, endpoint=False).astype(int))
+            self._decimation = (starts, numpy.repeat(xtime[starts], 2))
+        
+    def _decimate(self, source):
+        # (samples x channels) to (2 * pixels x channels), the minimum and maximum of each bin
+        starts, xplot = self._decimation # read once so a resize cannot mix bins and times
+        if starts is None:
+            return source, xplot
+        decimated = numpy.empty((2 * len(starts), source.shape[1]))
+        decimated[0::2,:] = numpy.minimum.reduceat(source, starts, axis=0)
+        decimated[1::2,:] = numpy.maximum.reduceat(source, starts, axis=0)
+        return decimated, xplot
+        
+    def _setlinex(self, xplot):
+        # the times only change when the window is resized
+        if xplot is not self._linex:
+            for cP in range(self.numberOfAcquiredChannels):
+                self.lines[cP].set_xdata(xplot)
+            self._linex = xplot
+        
+    def _prepbuffers(self):
+        # ready to plot frames: the sampler fills _work, _ready holds the newest complete frame,
+        # and _display is the one being drawn. Frames are only ever exchanged, never copied.
+        self._buffers = []
+        for cB in range(3):
+            frame = {}
+            frame['time'] = numpy.zeros((len(self._decimation[1]), self.numberOfAcquiredChannels))
+            frame['x'] = self._decimation[1]
+            frame['freq'] = numpy.zeros((len(self.freqxline), self.numberOfAcquiredChannels))
+            frame['pointstd'] = numpy.zeros(self.numberOfAcquiredChannels)
+            frame['powerlevel'] = self.powerlevel
+            self._buffers.append(frame)
+        self._work, self._ready, self._display = self._buffers
+        self.xplot = self._decimation[1]
+        self._linex = None
+        self._fresh = False
+        self._bufferlock = Lock()
+        
+    def _publishframe(self, frame):
+        # sampler side: fill the work frame, then exchange it with the ready frame
+        if (self._work['time'].shape != frame[0].shape):
+            self._work['time'] = numpy.zeros(frame[0].shape) # the window was resized
+        self._work['x'] = frame[4]
+        numpy.copyto(self._work['time'], frame[0])
+        numpy.copyto(self._work['freq'], frame[1])
+        self._work['pointstd'][:] = frame[3][0:self.numberOfAcquiredChannels]
+        self._work['powerlevel'] = frame[2]
+        self._bufferlock.acquire(True)
+        self._work, self._ready = self._ready, self._work
+        self._fresh = True
+        self._bufferlock.release()
+        
+    def _swapbuffers(self):
+        # viewer side: take the newest ready frame for display, returns False if nothing is new
+        self._bufferlock.acquire(True)
+        fresh = self._fresh
+        if fresh:
+            self._display, self._ready = self._ready, self._display
+            self._fresh = False
+        self._bufferlock.release()
+        if fresh:
+            self.datamatrixforplotting = self._display['time']
+            self.frequencymatrixforplotting = self._display['freq']
+            self.powerlevel = self._display['powerlevel']
+            self.xplot = self._display['x']
+        return fresh
+        
+    def _sampler(self):
+        while self._sampling:
+            t = time.perf_counter()
+            frame = self._processsamples()
+            if frame is not None:
+                self._publishframe(frame)
+            elapsed_time = time.perf_counter() - t
+            if (elapsed_time < self.samplinginterval):
+                time.sleep(self.samplinginterval - elapsed_time)
+        
+    def _prepblit(self):
+        # artists drawn on every update are animated so they are left out of the cached backgrounds
+        freqx = numpy.asarray(self.freqxline, dtype=float)
+        self.freqpolys = []
+        for cC in range(self.numberOfAcquiredChannels):
+            self.lines[cC].set_animated(True)
+            self.freqlines[cC].set_animated(True)
+            # the spectrum fill is one polygon: along the spectrum, then back along the baseline
+            verts = numpy.zeros((2 * len(freqx), 2))
+            verts[:len(freqx),0] = freqx
+            verts[:len(freqx),1] = self.freqoffset[cC]
+            verts[len(freqx):,0] = freqx[::-1]
+            verts[len(freqx):,1] = self.freqoffset[cC]
+            poly = matplotlib.collections.PolyCollection([verts], facecolors=[self.colorpalet[cC]], edgecolors='none', alpha=0.5, animated=True)
+            self.freqax.add_collection(poly, autolim=False)
+            self.freqpolys.append(poly)
+        
+        self._labelbins = [-1] * self.numberOfAcquiredChannels
+        self._batterytext = None
+        self._backgrounds = None
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+        
+    def _on_draw(self, *args):
+        # a full draw just finished: cache the empty axes, then put the animated artists back on top
+        self._backgrounds = [self.fig.canvas.copy_from_bbox(self.timeax.bbox), self.fig.canvas.copy_from_bbox(self.freqax.bbox)]
+        self._drawanimated()
+        
+    def _drawanimated(self):
+        for cC in range(self.numberOfAcquiredChannels):
+            self.timeax.draw_artist(self.lines[cC])
+            self.freqax.draw_artist(self.freqpolys[cC])
+            self.freqax.draw_artist(self.freqlines[cC])
+            
+    def _qualitybin(self, pstd):
+        # index of the label color for a channel variability
+        for cT in range(len(self.qualitythresholds)):
+            if (pstd < self.qualitythresholds[cT]):
+                return cT
+        return len(self.qualitythresholds)
         
     def eegscaleupbutton_clk(self, *args): 
         tempvalue = self.timeplotscale * 2.0
@@ -338,10 +488,16 @@ class Viewer():
         self.updatescale()
         
         print('Close window to disconnect...')
-        ani = matplotlib.animation.FuncAnimation(self.fig, self.update, interval=self.updatetime, blit=False)
+        if self.blitting:
+            self._timer = self.fig.canvas.new_timer(interval=self.updatetime)
+            self._timer.add_callback(self.update)
+            self._timer.start()
+        else:
+            ani = matplotlib.animation.FuncAnimation(self.fig, self.update, interval=self.updatetime, blit=False)
         matplotlib.pyplot.show()
         
     def handle_close(self, evt, *args):
+        self._sampling = False
         #print('Shutting down data viewer...')
         #matplotlib.pyplot.close()
         #self.UnicornBlack.disconnect()
@@ -350,11 +506,20 @@ class Viewer():
         
     def update(self, *args):
         
-        threspoints = [12, 16, 30, 60]
+        if self.blitting:
+            return self._updateblit()
+        
+        threspoints = self.qualitythresholds
         self.freqax.collections.clear()
         self.freqfillbetween = []
 
-        self.updatesamples()
+        if self.backgroundsampling:
+            self._swapbuffers()
+            pointstd = self._display['pointstd'] # the sampler thread keeps replacing datacheck.pointstd
+        else:
+            self.updatesamples()
+            pointstd = self.datacheck.pointstd
+        self._setlinex(self.xplot)
         
         boolcont = True
         try:
@@ -369,7 +534,7 @@ class Viewer():
             for cP in range(self.numberOfAcquiredChannels):
                 try:
                     datavector = self.datamatrixforplotting[:,cP]
-                    pstd = self.datacheck.pointstd[cP]
+                    pstd = pointstd[cP]
                     if (pstd < threspoints[0]):
                         newtexture = self.greatchannel
                     elif ((pstd >= threspoints[0]) and (pstd < threspoints[1])):
@@ -394,14 +559,72 @@ class Viewer():
             
         return self.batterylabel, self.chanlables[0], self.chanlables[1], self.chanlables[2], self.chanlables[3], self.chanlables[4], self.chanlables[5], self.chanlables[6], self.chanlables[7], self.lines[0], self.lines[1], self.lines[2], self.lines[3], self.lines[4], self.lines[5], self.lines[6], self.lines[7]
             
+    def _updateblit(self):
+        # only the lines and spectrum fills are redrawn, from frames allocated once in prep
+        if self.backgroundsampling:
+            if not self._swapbuffers():
+                return # nothing new since the last draw
+        else:
+            frame = self._processsamples()
+            if frame is None:
+                return
+            self._publishframe(frame)
+            self._swapbuffers()
+        frame = self._display
+        
+        fulldraw = False
+        batterytext = 'Battery: %d%%' % self.powerlevel
+        if (batterytext != self._batterytext):
+            self.batterylabel.set_text(batterytext)
+            self._batterytext = batterytext
+            fulldraw = True
+        colors = [self.greatchannel, self.goodchannel, self.almostchannel, self.gettingtherechannel, self.badchannel]
+        for cP in range(self.numberOfAcquiredChannels):
+            try:
+                newbin = self._qualitybin(frame['pointstd'][cP])
+            except (IndexError, TypeError):
+                continue
+            if (newbin != self._labelbins[cP]):
+                # the label only changes color when the channel moves to another quality bin
+                bboxpatch = self.chanlables[self.numberOfAcquiredChannels-1-cP].get_bbox_patch()
+                bboxpatch.set_facecolor(colors[newbin])
+                bboxpatch.set_edgecolor(colors[newbin])
+                self._labelbins[cP] = newbin
+                fulldraw = True
+        
+        self._setlinex(frame['x'])
+        freqpoints = frame['freq'].shape[0]
+        for cP in range(self.numberOfAcquiredChannels):
+            self.lines[cP].set_ydata(frame['time'][:,cP])
+            self.freqlines[cP].set_ydata(frame['freq'][:,cP])
+            vertices = self.freqpolys[cP].get_paths()[0].vertices
+            vertices[:freqpoints,1] = frame['freq'][:,cP]
+            vertices[-1,1] = frame['freq'][0,cP] # closing vertex
+            self.freqpolys[cP].stale = True
+        
+        if fulldraw or (self._backgrounds is None):
+            self.fig.canvas.draw_idle() # the cached backgrounds are refreshed by _on_draw
+            return
+        self.fig.canvas.restore_region(self._backgrounds[0])
+        self.fig.canvas.restore_region(self._backgrounds[1])
+        self._drawanimated()
+        self.fig.canvas.blit(self.timeax.bbox)
+        self.fig.canvas.blit(self.freqax.bbox)
+        self.fig.canvas.flush_events()
+            
     def updatesamples(self):
+        # pulls and processes the data on the calling thread
+        frame = self._processsamples()
+        if frame is not None:
+            self.datamatrixforplotting, self.frequencymatrixforplotting, self.powerlevel, pointstd, self.xplot = frame
+            
+    def _processsamples(self):
         # this whole function takes about 60 ms to complete
         # it takes about 50 ms to pull the data
         # it takes about 15 ms to filter the data and compute the PSD
         # the rest is all pretty fast
+        # returns (time matrix, frequency matrix, battery level, pointstd, times) or None
         
-        #while self._sampling:
-            
         #t = time.perf_counter()
         
         boolcont = True
@@ -412,7 +635,7 @@ class Viewer():
         
         if boolcont:    
             try:
-                self.powerlevel = int(_plottingdata[-1,-3])
+                powerlevel = int(_plottingdata[-1,-3])
             
                
                 self.datacheck.data = _plottingdata
@@ -423,9 +646,7 @@ class Viewer():
                     _plottingdata = _plottingdata[:,self._trimspantrailpoints:-self._trimspanleadpoints]
                     
                 _plottingdata[0:8,:] = numpy.flipud(_plottingdata[0:8,:])
-                _plottingdata = self._computedataoffset(_plottingdata)
-
-                self.datamatrixforplotting = _plottingdata[:]
+                _plottingdata, xplot = self._decimate(self._computedataoffset(_plottingdata))
                 
                 # manage frequency data
                 _freqdatanoise = numpy.array(self.datacheck.psddata, copy=True)
@@ -435,7 +656,7 @@ class Viewer():
                 _freqdata[0:8,:] = numpy.flipud(_freqdata[0:8,:])
                 _freqdata = self._computefreqoffset(_freqdata)
                 
-                self.frequencymatrixforplotting = _freqdata[:]
+                return _plottingdata, _freqdata, powerlevel, numpy.array(self.datacheck.pointstd), xplot
                 
             except:
                 boolcont = False
@@ -443,6 +664,7 @@ class Viewer():
         
         #elapsed_time = time.perf_counter() - t
         #self.updatetimelog.append(elapsed_time)
+        return None
             
 
 if __name__ == '__main__':
@@ -0,0 +1,158 @@
+# unicornpysimulator: software stand in for the g.tec UnicornPy device API
+#
+"""
+Provides the same calls as UnicornPy (GetAvailableDevices, Unicorn, DeviceException)
+so the unicornhybridblack module can be run and benchmarked without the hardware or the
+Windows only UnicornPy.pyd.
+
+The simulator is selected at import time by setting the UNICORN_SIMULATOR environment
+variable before unicornhybridblack is imported:
+
+    import os
+    os.environ['UNICORN_SIMULATOR'] = '1'
+    import unicornhybridblack
+
+Frames have the 17 channel layout of the Unicorn Hybrid Black at 250 Hz:
+    8 EEG channels (microvolts), 3 accelerometer, 3 gyroscope, battery (percent),
+    sample counter, and validation indicator
+
+Signal properties are controlled through the module level settings object. Because the
+acquisition process of UnicornBlackProcess imports this module again, each setting can
+also be provided as an environment variable (shown in brackets):
+    speed           1.0 is real time, 10.0 ten times faster, 0 as fast as possible  [UNICORN_SIMULATOR_SPEED]
+    linenoise       amplitude of the 60 Hz line noise in microvolts                  [UNICORN_SIMULATOR_LINENOISE]
+    drift           standard deviation of the per sample baseline random walk         [UNICORN_SIMULATOR_DRIFT]
+    droprate        probability that a sample is skipped by the counter               [UNICORN_SIMULATOR_DROPRATE]
+    duplicaterate   probability that a sample is delivered twice                      [UNICORN_SIMULATOR_DUPLICATERATE]
+    batterydecay    battery percent lost per minute of acquisition                    [UNICORN_SIMULATOR_BATTERYDECAY]
+    seed            random seed for reproducible runs                                 [UNICORN_SIMULATOR_SEED]
+
+@author: Matt Pontifex
+"""
+
+import os
+import math
+import time
+import numpy
+
+
+class UnicornSimulatorSettings():
+
+    def __init__(self):
+        self.samplefreq = 250.0
+        self.speed = float(os.environ.get('UNICORN_SIMULATOR_SPEED', 1.0))
+        self.linenoise = float(os.environ.get('UNICORN_SIMULATOR_LINENOISE', 20.0))
+        self.linefreq = 60.0
+        self.drift = float(os.environ.get('UNICORN_SIMULATOR_DRIFT', 0.5))
+        self.droprate = float(os.environ.get('UNICORN_SIMULATOR_DROPRATE', 0.0))
+        self.duplicaterate = float(os.environ.get('UNICORN_SIMULATOR_DUPLICATERATE', 0.0))
+        self.batterylevel = 100.0
+        self.batterydecay = float(os.environ.get('UNICORN_SIMULATOR_BATTERYDECAY', 0.1))
+        self.seed = int(os.environ.get('UNICORN_SIMULATOR_SEED', 0))
+        self.devices = ['UN-0000.00.00']
+        self.alphaamplitude = 10.0 # microvolts
+        self.noiseamplitude = 5.0 # microvolts
+
+settings = UnicornSimulatorSettings()
+
+
+class DeviceException(Exception):
+    pass
+
+
+class UnicornConfiguration():
+
+    def __init__(self):
+        self.Channels = ['EEG 1', 'EEG 2', 'EEG 3', 'EEG 4', 'EEG 5', 'EEG 6', 'EEG 7', 'EEG 8', 'Accelerometer X', 'Accelerometer Y', 'Accelerometer Z', 'Gyroscope X', 'Gyroscope Y', 'Gyroscope Z', 'Battery Level', 'Counter', 'Validation Indicator']
+
+
+def GetAvailableDevices(onlyPaired=True):
+    return list(settings.devices)
+
+
+class Unicorn():
+    """simulated Unicorn Hybrid Black
+    """
+
+    def __init__(self, serial):
+        # any serial is accepted so task scripts with a hard coded device run unchanged
+        if serial is None:
+            raise DeviceException('No device serial was provided.')
+        self.serial = serial
+        self._numberOfAcquiredChannels = 17
+        self._eegchannels = 8
+        self._configuration = UnicornConfiguration()
+        self._random = numpy.random.default_rng(settings.seed)
+        self._acquiring = False
+        self._scans = 0 # scans delivered since StartAcquisition
+        self._counter = 0
+        self._starttime = None
+        self._baseline = self._random.normal(0.0, 200.0, self._eegchannels)
+        self._alphaphase = self._random.uniform(0.0, 2 * math.pi, self._eegchannels)
+        self._lastscan = numpy.zeros(self._numberOfAcquiredChannels, dtype=numpy.float32)
+
+    def GetNumberOfAcquiredChannels(self):
+        return self._numberOfAcquiredChannels
+
+    def GetConfiguration(self):
+        return self._configuration
+
+    def StartAcquisition(self, testSignalEnabled=False):
+        self._acquiring = True
+        self._scans = 0
+        self._starttime = time.perf_counter()
+
+    def StopAcquisition(self):
+        if not self._acquiring:
+            raise DeviceException('Acquisition is not running.')
+        self._acquiring = False
+
+    def GetData(self, numberOfScans, destinationBuffer, destinationBufferLength):
+        if not self._acquiring:
+            raise DeviceException('Acquisition is not running.')
+        numberOfScans = int(numberOfScans)
+        if (destinationBufferLength < (numberOfScans * self._numberOfAcquiredChannels * 4)):
+            raise DeviceException('The destination buffer is too small.')
+
+        # block until the device would have produced these scans
+        if (settings.speed > 0):
+            duetime = self._starttime + ((self._scans + numberOfScans) / (settings.samplefreq * settings.speed))
+            waittime = duetime - time.perf_counter()
+            if (waittime > 0):
+                time.sleep(waittime)
+
+        frame = numpy.frombuffer(destinationBuffer, dtype=numpy.float32, count=numberOfScans * self._numberOfAcquiredChannels).reshape((numberOfScans, self._numberOfAcquiredChannels))
+        frame[:,:] = self._frame(numberOfScans)
+        self._scans = self._scans + numberOfScans
+
+    def _frame(self, numberOfScans):
+        # build the next numberOfScans rows of simulated data
+        increments = 1 + (self._random.random(numberOfScans) < settings.droprate) # dropped samples skip a counter value
+        duplicates = self._random.random(numberOfScans) < settings.duplicaterate
+        increments[duplicates] = 0
+        counters = self._counter + numpy.cumsum(increments)
+        self._counter = int(counters[-1])
+
+        seconds = (counters / settings.samplefreq)[:,numpy.newaxis]
+        self._baseline = self._baseline + (self._random.normal(0.0, settings.drift, self._eegchannels) * math.sqrt(numberOfScans))
+        eeg = self._baseline + (self._random.normal(0.0, settings.noiseamplitude, (numberOfScans, self._eegchannels)))
+        eeg = eeg + (settings.alphaamplitude * numpy.sin((2 * math.pi * 10.0 * seconds) + self._alphaphase))
+        eeg = eeg + (settings.linenoise * numpy.sin(2 * math.pi * settings.linefreq * seconds))
+
+        frame = numpy.zeros((numberOfScans, self._numberOfAcquiredChannels), dtype=numpy.float32)
+        frame[:,0:8] = eeg
+        frame[:,8:11] = [0.0, 0.0, 1.0] + self._random.normal(0.0, 0.002, (numberOfScans, 3)) # accelerometer (g)
+        frame[:,11:14] = self._random.normal(0.0, 0.5, (numberOfScans, 3)) # gyroscope (deg/s)
+        elapsedminutes = self._counter / settings.samplefreq / 60.0
+        frame[:,14] = max(settings.batterylevel - (settings.batterydecay * elapsedminutes), 0.0)
+        frame[:,15] = counters
+        frame[:,16] = 1.0
+
+        # a duplicated sample repeats the row before it
+        for incrX in numpy.flatnonzero(duplicates):
+            if (incrX == 0):
+                frame[incrX,:] = self._lastscan
+            else:
+                frame[incrX,:] = frame[incrX - 1,:]
+        self._lastscan = frame[-1,:].copy()
+        return frame
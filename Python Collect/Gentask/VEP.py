@@ -74,17 +74,17 @@ if __name__ == "__main__":
     
     
     # Rapid Process EEG
-    EEG = eeg.pipe.readUnicornBlack(task.outputfile)
-    EEG = simplefilter(EEG, Filter = 'Notch', Cutoff = [60.0])
-    EEG = simplefilter(EEG, Filter = 'Bandpass', Design = 'Butter', Cutoff = [1.0, 25.0], Order=3)
-    EEG = simpleepoch(EEG, Window = [-200.0, 600.0], Types = [10008, 10009])
-    EEG = simplebaselinecorrect(EEG, Window = [-100.0, 0.0])
-    EEG = voltagethreshold(EEG, Threshold = [-100.0, 100.0], Step = 50.0)
-    EEG = simplepsd(EEG, Scale = 500, Ceiling = 30.0)
-    EEG = simplefilter(EEG, Design = 'savitzky-golay', Order = 4)
-    EEG = simplezwave(EEG, BaselineWindow = [-200.0, 0.0])
-    EEG = simpleaverage(EEG, Approach = 'Mean', BaselineWindow = [-100, 0])
-    saveset(EEG, task.outputfile)
+    EEG = eegpipe.readUnicornBlack(task.outputfile)
+    EEG = eegpipe.simplefilter(EEG, Filter = 'Notch', Cutoff = [60.0])
+    EEG = eegpipe.simplefilter(EEG, Filter = 'Bandpass', Design = 'Butter', Cutoff = [1.0, 25.0], Order=3)
+    EEG = eegpipe.simpleepoch(EEG, Window = [-200.0, 600.0], Types = [10008, 10009])
+    EEG = eegpipe.simplebaselinecorrect(EEG, Window = [-100.0, 0.0])
+    EEG = eegpipe.voltagethreshold(EEG, Threshold = [-100.0, 100.0], Step = 50.0)
+    EEG = eegpipe.simplepsd(EEG, Scale = 500, Ceiling = 30.0)
+    EEG = eegpipe.simplefilter(EEG, Design = 'savitzky-golay', Order = 4)
+    EEG = eegpipe.simplezwave(EEG, BaselineWindow = [-200.0, 0.0])
+    EEG = eegpipe.simpleaverage(EEG, Approach = 'Mean', BaselineWindow = [-100, 0])
+    eegpipe.saveset(EEG, task.outputfile)
     
     # Backup data
     #filesync.pushfiles(inpath = '\\Studies\Raw', outpath = 'Z:\Studies\Raw', file_types = ['.psydat', '.tsv', '.tsve', '.csv', '.csve'])